@@ -0,0 +1,133 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GROUP_BY = ['source_ip', 'destination_ip', 'protocol', 'detector', 'rules']
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class AlertAggregator:
+    """Collapse repeated anomalies into one alert per key and time window
+
+    Anomalous packets are grouped on the group_by fields. A group opens at
+    its first anomaly and closes window seconds later, when the callback
+    receives a single alert with the count, first/last seen times and the
+    max/mean score. observe() reports which packet opened a group, so the
+    caller can still show that one packet individually. Open groups live in an insertion-ordered map, so the
+    oldest is always first to expire; when max_groups are open the oldest
+    group is closed early rather than dropped.
+    """
+
+    def __init__(self, callback, window=5.0, group_by=None, max_groups=10000):
+        self.callback = callback
+        self.window = window
+        self.group_by = list(group_by or DEFAULT_GROUP_BY)
+        self.max_groups = max_groups
+        self.groups = OrderedDict()
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.anomalies = 0
+        self.alerts = 0
+        self.evicted = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._expiry_worker, daemon=True)
+        self.thread.start()
+        logger.info(f"Alert aggregator started (window {self.window}s, keys {self.group_by})")
+
+    def stop(self):
+        self.running = False
+        self.flush()
+
+    def observe(self, packet_data):
+        """Fold an anomalous packet into its group; True if it opened the group"""
+        if not packet_data.get('is_anomaly'):
+            return False
+
+        # List fields such as the matched rule names key as tuples
+        key = tuple(_hashable(packet_data.get(field)) for field in self.group_by)
+        score = float(packet_data.get('anomaly_score') or 0.0)
+        now = time.time()
+        evicted = None
+
+        with self.lock:
+            self.anomalies += 1
+            group = self.groups.get(key)
+            if group is None:
+                if len(self.groups) >= self.max_groups:
+                    evicted = self.groups.popitem(last=False)
+                    self.evicted += 1
+                group = self.groups[key] = {
+                    'first_seen': now, 'last_seen': now, 'count': 0,
+                    'score_sum': 0.0, 'max_score': score, 'last_packet_id': None
+                }
+            group['count'] += 1
+            opened = group['count'] == 1
+            group['last_seen'] = now
+            group['score_sum'] += score
+            group['max_score'] = max(group['max_score'], score)
+            group['last_packet_id'] = packet_data.get('id')
+
+        if evicted:
+            self._emit(*evicted)
+        return opened
+
+    def _expiry_worker(self):
+        while self.running:
+            time.sleep(min(self.window / 4, 1.0))
+            self.flush(expired_only=True)
+
+    def flush(self, expired_only=False):
+        """Emit closed groups (all groups unless expired_only)"""
+        cutoff = time.time() - self.window
+        closed = []
+        with self.lock:
+            while self.groups:
+                key, group = next(iter(self.groups.items()))
+                if expired_only and group['first_seen'] > cutoff:
+                    break
+                self.groups.popitem(last=False)
+                closed.append((key, group))
+
+        for key, group in closed:
+            self._emit(key, group)
+
+    def _emit(self, key, group):
+        alert = dict(zip(self.group_by, key))
+        alert.update({
+            'count': group['count'],
+            'first_seen': datetime.fromtimestamp(group['first_seen']).isoformat(),
+            'last_seen': datetime.fromtimestamp(group['last_seen']).isoformat(),
+            'max_score': group['max_score'],
+            'mean_score': group['score_sum'] / group['count'],
+            'last_packet_id': group['last_packet_id'],
+            'window': self.window
+        })
+        with self.lock:
+            self.alerts += 1
+        try:
+            self.callback(alert)
+        except Exception as e:
+            logger.error(f"Error emitting alert: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'window': self.window,
+                'group_by': self.group_by,
+                'open_groups': len(self.groups),
+                'anomalies': self.anomalies,
+                'alerts': self.alerts,
+                'evicted': self.evicted
+            }
@@ -1,15 +1,27 @@
 import os
-import json
+import hmac
 import logging
+import argparse
 from datetime import datetime
 from flask import Flask, request, jsonify
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import threading
 import time
-from packet_capture import PacketCapture
+from packet_capture import PacketCapture, MultiInterfaceCapture
 from ml_models import AnomalyDetector
 from encryption import EncryptionManager
+from key_manager import KeyManager
+from export_formats import encode_logs, supported_compressions
+from integrity import IntegrityLog, parse_timestamp
+from rule_engine import RuleEngine
+from link_monitor import LinkMonitor
+from flow_sampler import FlowSampler
+from sensor import SensorAgent, CollectorServer, SECRET_ENV
+from alert_aggregator import AlertAggregator
+from replay import ReplayBuffer
+from emitter import SocketEmitter
+from profiler import ProfileSession, TOKEN_ENV
 from config import Config
 
 # Configure logging
@@ -18,14 +30,43 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'smart-network-monitor-secret-key'
-CORS(app, origins=["http://localhost:5173"])
-socketio = SocketIO(app, cors_allowed_origins=["http://localhost:5173"], logger=True, engineio_logger=True)
+# Frontend dev server origin, for REST and Socket.IO alike
+ALLOWED_ORIGINS = ["http://localhost:5173"]
+CORS(app, origins=ALLOWED_ORIGINS)
+# Bound to the app by configure_server() once the serving mode is known
+socketio = SocketIO()
 
 # Global instances
 packet_capture = None
 anomaly_detector = None
 encryption_manager = None
+link_monitor = None
+flow_sampler = None
+alert_aggregator = None
+collector = None
 config = Config()
+integrity_log = None
+if config.integrity_enabled:
+    try:
+        integrity_log = IntegrityLog(
+            directory=config.integrity_dir,
+            chunk_packets=config.integrity_chunk_packets,
+            segment_chunks=config.integrity_segment_chunks,
+            retention_segments=config.integrity_retention_segments
+        )
+    except Exception as e:
+        # Never append to a log that didn't load; it needs repair first
+        logger.error(f"Integrity log disabled, {config.integrity_dir} could not be loaded: {e}")
+key_manager = KeyManager(
+    directory=config.keystore_dir,
+    rsa_pool_size=config.rsa_pool_size
+)
+rule_engine = RuleEngine(config.rules_file, config.rules_reload_interval)
+replay_buffer = ReplayBuffer(config.replay_buffer_size, config.replay_max_gap)
+emitter = SocketEmitter(socketio, config.emit_queue_size, config.emit_batch_size)
+client_lock = threading.Lock()
+connected_clients = 0
+profile_session = None
 capture_thread = None
 is_capturing = False
 
@@ -34,27 +75,273 @@ def initialize_components():
     global anomaly_detector, encryption_manager
     
     try:
-        anomaly_detector = AnomalyDetector(
-            model_type=config.ml_model,
-            feature_level=config.feature_level
-        )
-        encryption_manager = EncryptionManager(config.encryption_algorithm)
+        anomaly_detector = build_detector()
+        encryption_manager = build_encryption_manager()
+        swap_link_monitor(build_link_monitor())
+        swap_alert_aggregator(build_alert_aggregator())
         logger.info("Components initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize components: {e}")
 
-def packet_callback(packet_data):
+rebuild_lock = threading.Lock()
+rebuild_generations = {}
+
+def build_detector():
+    """Build a detector for the current config, reusing trained state where possible"""
+    if anomaly_detector:
+        detector = anomaly_detector.reconfigure(config.ml_model, config.feature_level)
+    else:
+        detector = AnomalyDetector(model_type=config.ml_model, feature_level=config.feature_level)
+    detector.rule_engine = rule_engine
+    detector.configure_cache(config.prediction_cache_size, config.prediction_cache_length_bucket)
+    detector.configure_thresholds(
+        config.adaptive_thresholds,
+        config.target_alert_rate,
+        config.threshold_window,
+        config.threshold_buckets
+    )
+    detector.configure_cascade(
+        config.cascade_rule_threshold,
+        config.cascade_normal_margin,
+        config.cascade_anomaly_margin
+    )
+    return detector
+
+def swap_detector(detector):
+    global anomaly_detector
+    detector.rule_engine = rule_engine  # in case the rules were rebuilt meanwhile
+    anomaly_detector = detector
+
+def build_rule_engine():
+    return RuleEngine(config.rules_file, config.rules_reload_interval)
+
+def swap_rule_engine(engine):
+    global rule_engine
+    rule_engine = engine
+    if anomaly_detector:
+        anomaly_detector.rule_engine = engine
+
+def build_encryption_manager():
+    """Build an encryption manager for the current algorithm"""
+    if config.encryption_algorithm == 'RSA':
+        key_manager.start_rsa_pool()
+    return EncryptionManager(config.encryption_algorithm, key_manager=key_manager)
+
+def swap_encryption_manager(manager):
+    global encryption_manager
+    encryption_manager = manager
+
+def run_blocking(func, *args):
+    """Run slow request work where it can't stall other clients
+
+    The production server runs eventlet without monkey-patching, so a
+    handler that blocks holds up every greenlet; tpool moves the call to a
+    real OS thread. In threading mode each request has its own thread already.
+    """
+    if socketio.async_mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    return func(*args)
+
+def emit_sequenced(event, payload):
+    """Emit an event that reconnecting clients can replay by sequence number"""
+    replay_buffer.record(event, payload)
+    emitter.put(event, payload)
+
+def emit_link_stats(stats):
+    """Push interface counter rates to the dashboard"""
+    emitter.put('link_stats', stats)
+
+def build_link_monitor():
+    """Build the counter-only link monitor, or None when disabled"""
+    if not config.link_monitor_enabled:
+        return None
+    return LinkMonitor(
+        callback=emit_link_stats,
+        interval=config.link_monitor_interval,
+        history=config.link_monitor_history,
+        emit_interval=config.link_monitor_emit_interval
+    )
+
+def swap_link_monitor(monitor):
+    global link_monitor
+    previous = link_monitor
+    link_monitor = monitor
+    if previous:
+        previous.stop()
+    if monitor:
+        monitor.start()
+
+def emit_alert(alert):
+    """Push an aggregated alert to the dashboard"""
+    emit_sequenced('alert', alert)
+
+def build_alert_aggregator():
+    """Build the alert aggregator, or None when disabled"""
+    if not config.alerts_enabled:
+        return None
+    return AlertAggregator(
+        emit_alert,
+        window=config.alert_window,
+        group_by=config.alert_group_by,
+        max_groups=config.alert_max_groups
+    )
+
+def swap_alert_aggregator(aggregator):
+    global alert_aggregator
+    previous = alert_aggregator
+    alert_aggregator = aggregator
+    if previous:
+        previous.stop()  # emits the groups it still holds
+    if aggregator:
+        aggregator.start()
+
+COMPONENT_SETTINGS = {
+    'anomaly_detector': (
+        ['ml_model', 'feature_level', 'prediction_cache_size', 'prediction_cache_length_bucket',
+         'cascade_rule_threshold', 'cascade_normal_margin', 'cascade_anomaly_margin',
+         'adaptive_thresholds', 'target_alert_rate', 'threshold_window', 'threshold_buckets'],
+        build_detector, swap_detector
+    ),
+    'encryption_manager': (['encryption_algorithm'], build_encryption_manager, swap_encryption_manager),
+    'link_monitor': (
+        ['link_monitor_enabled', 'link_monitor_interval', 'link_monitor_history', 'link_monitor_emit_interval'],
+        build_link_monitor, swap_link_monitor
+    ),
+    'alert_aggregator': (
+        ['alerts_enabled', 'alert_window', 'alert_group_by', 'alert_max_groups'],
+        build_alert_aggregator, swap_alert_aggregator
+    ),
+    'rule_engine': (['rules_file', 'rules_reload_interval'], build_rule_engine, swap_rule_engine),
+}
+
+# Read when capture starts: a running capture keeps its old values
+CAPTURE_SETTINGS = [
+    'network_interface', 'capture_mode', 'capture_filter', 'snaplen', 'interface_queue_size',
+    'merge_delay', 'sampling_enabled', 'sampling_target_utilization', 'sampling_min_ratio',
+    'sampling_adjust_interval'
+]
+
+# Read once at process start
+STARTUP_SETTINGS = [
+    'integrity_enabled', 'integrity_dir', 'integrity_chunk_packets', 'integrity_segment_chunks',
+    'integrity_retention_segments', 'keystore_dir', 'rsa_pool_size', 'replay_buffer_size',
+    'replay_max_gap', 'emit_queue_size', 'emit_batch_size', 'mode', 'collector_address',
+    'collector_queue_size', 'agent_id', 'agent_batch_size', 'agent_flush_interval',
+    'agent_spool_batches', 'agent_compression_level', 'agent_max_in_flight', 'agent_ack_timeout', 'agent_local_scoring',
+    'server_mode', 'server_host', 'server_port', 'async_mode', 'server_pool_size'
+]
+
+def schedule_rebuild(component):
+    """Rebuild a component in the background and swap it in when ready"""
+    _, builder, swap = COMPONENT_SETTINGS[component]
+    
+    with rebuild_lock:
+        generation = rebuild_generations.get(component, 0) + 1
+        rebuild_generations[component] = generation
+    
+    def worker():
+        try:
+            instance = builder()
+        except Exception as e:
+            logger.error(f"Failed to rebuild {component}: {e}")
+            return
+        
+        with rebuild_lock:
+            # A newer config change superseded this build
+            if rebuild_generations[component] != generation:
+                return
+            swap(instance)
+        logger.info(f"Component {component} rebuilt")
+    
+    threading.Thread(target=worker, daemon=True).start()
+
+# Only settable in config.json or on the command line, never by API clients
+LOCAL_SETTINGS = ['profiling_enabled']
+
+def apply_config(data):
+    """Apply a config update, rebuilding only components whose settings changed
+
+    Returns (changed, rebuilding, requires_restart); the last lists changed
+    keys that are saved but won't take effect until capture or the backend
+    is restarted. Changing a LOCAL_SETTINGS key raises ValueError; echoing
+    its current value back (as a full config dict does) is allowed.
+    """
+    for key in LOCAL_SETTINGS:
+        if key in data and data[key] != getattr(config, key):
+            raise ValueError(f"{key} can only be set in config.json or on the command line")
+    changed = config.update({k: v for k, v in data.items() if k not in LOCAL_SETTINGS})
+    
+    rebuilding = []
+    for component, (settings, _, _) in COMPONENT_SETTINGS.items():
+        if any(key in changed for key in settings):
+            schedule_rebuild(component)
+            rebuilding.append(component)
+    
+    pending = STARTUP_SETTINGS + (CAPTURE_SETTINGS if is_capturing else [])
+    requires_restart = sorted(key for key in changed if key in pending)
+    
+    return changed, rebuilding, requires_restart
+
+def tag_rules(packet_data, rule_result=None):
+    """Record the names of the rules an anomalous packet matched"""
+    try:
+        if rule_result is None:
+            rule_result = rule_engine.evaluate_packet(packet_data)
+        packet_data['rules'] = rule_result[2]
+    except Exception as e:
+        logger.error(f"Rule tagging error: {e}")
+        packet_data['rules'] = []
+
+def rule_precheck(packet_data):
+    """Sampling precheck: (flagged, rule result), so the rules run once per packet"""
+    rule_result = rule_engine.evaluate_packet(packet_data)
+    return rule_result[0], rule_result
+
+def score_packet(detector, packet_data, rule_result=None):
+    """Score a packet and tag anomalies with their rules
+
+    rule_result is the rule engine's evaluate_packet result when the caller
+    already has it; otherwise the rules are evaluated here at most once.
+    """
+    if rule_result is None and detector.uses_rules:
+        rule_result = rule_engine.evaluate_packet(packet_data)
+    packet_data['is_anomaly'], packet_data['anomaly_score'] = detector.predict(packet_data, rule_result)
+    packet_data['detector'] = detector.detector_name
+    if packet_data['is_anomaly']:
+        tag_rules(packet_data, rule_result)
+
+def packet_callback(packet_data, rule_result=None):
     """Callback function for when a packet is captured"""
     try:
+        # Read once so a concurrent rebuild swap can't change it mid-packet
+        detector = anomaly_detector
+        
         # Process packet through ML models
-        if anomaly_detector:
-            packet_data['is_anomaly'], packet_data['anomaly_score'] = anomaly_detector.predict(packet_data)
+        if packet_data.get('scored_locally'):
+            pass  # already scored by the sensor agent that shipped it
+        elif detector:
+            score_packet(detector, packet_data, rule_result)
         else:
             packet_data['is_anomaly'] = False
             packet_data['anomaly_score'] = 0.0
+        if packet_data['is_anomaly'] and 'rules' not in packet_data:
+            tag_rules(packet_data, rule_result)
+        
+        # Append to the tamper-evident log
+        if integrity_log:
+            integrity_log.record(packet_data)
         
-        # Emit packet to frontend
-        socketio.emit('packet_captured', packet_data)
+        # Repeated anomalies become one alert per key and window instead of
+        # one event per packet. The packet that opens a group is still sent,
+        # since clients chart and export anomalies from packet_captured
+        aggregator = alert_aggregator
+        if aggregator and packet_data['is_anomaly']:
+            if aggregator.observe(packet_data):
+                packet_data['alert_opened'] = True
+                emit_sequenced('packet_captured', packet_data)
+        else:
+            emit_sequenced('packet_captured', packet_data)
         logger.debug(f"Packet emitted: {packet_data['id']}")
         
     except Exception as e:
@@ -62,21 +349,41 @@ def packet_callback(packet_data):
 
 def capture_worker():
     """Worker thread for packet capture"""
-    global packet_capture, is_capturing
+    global packet_capture, flow_sampler, is_capturing
     
     try:
-        packet_capture = PacketCapture(
-            interface=config.network_interface,
-            callback=packet_callback
+        callback = packet_callback
+        if config.sampling_enabled:
+            # Rule hits are always scored, whatever the sampling ratio
+            flow_sampler = FlowSampler(
+                packet_callback,
+                precheck=rule_precheck,
+                target_utilization=config.sampling_target_utilization,
+                min_ratio=config.sampling_min_ratio,
+                adjust_interval=config.sampling_adjust_interval
+            )
+            callback = flow_sampler.process
+        else:
+            flow_sampler = None
+        
+        interfaces = config.network_interfaces
+        packet_capture = MultiInterfaceCapture(
+            interfaces,
+            callback=callback,
+            queue_size=config.interface_queue_size,
+            merge_delay=config.merge_delay,
+            bpf_filter=config.capture_filter,
+            snaplen=config.snaplen,
+            capture_mode=config.capture_mode
         )
         
-        logger.info(f"Starting packet capture on interface: {config.network_interface}")
+        logger.info(f"Starting packet capture on interfaces: {', '.join(interfaces)}")
         packet_capture.start_capture()
         
     except Exception as e:
         logger.error(f"Capture worker error: {e}")
         is_capturing = False
-        socketio.emit('capture_error', {'error': str(e)})
+        emitter.put('capture_error', {'error': str(e)})
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
@@ -85,6 +392,17 @@ def get_status():
         'status': 'running',
         'capturing': is_capturing,
         'config': config.to_dict(),
+        'prediction_cache': anomaly_detector.cache_stats() if anomaly_detector else None,
+        'cascade': anomaly_detector.cascade_stats() if anomaly_detector else None,
+        'thresholds': anomaly_detector.threshold_stats() if anomaly_detector else None,
+        'interfaces': packet_capture.get_stats() if packet_capture else None,
+        'sampling': flow_sampler.stats() if flow_sampler else None,
+        'mode': config.mode,
+        'agents': collector.get_stats() if collector else None,
+        'alerts': alert_aggregator.stats() if alert_aggregator else None,
+        'emitter': emitter.stats(),
+        'clients': connected_clients,
+        'profile': profile_session.status(False) if profile_session else None,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -97,13 +415,15 @@ def handle_config():
     elif request.method == 'POST':
         try:
             data = request.get_json()
-            config.update(data)
-            
-            # Reinitialize components if needed
-            if any(key in data for key in ['ml_model', 'feature_level', 'encryption_algorithm']):
-                initialize_components()
+            changed, rebuilding, requires_restart = apply_config(data)
             
-            return jsonify({'status': 'success', 'config': config.to_dict()})
+            return jsonify({
+                'status': 'success',
+                'config': config.to_dict(),
+                'changed': sorted(changed),
+                'rebuilding': rebuilding,
+                'requires_restart': requires_restart
+            })
         except Exception as e:
             return jsonify({'status': 'error', 'message': str(e)}), 400
 
@@ -116,34 +436,145 @@ def get_interfaces():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/link_stats', methods=['GET'])
+def get_link_stats():
+    """Recent per-interface rates from the counter-only link monitor"""
+    if not link_monitor:
+        return jsonify({'error': 'Link monitor is disabled'}), 404
+    
+    samples = request.args.get('samples', type=int)
+    return jsonify(link_monitor.get_history(request.args.get('interface'), samples))
+
+@app.route('/api/integrity/verify', methods=['GET'])
+def verify_integrity():
+    """Verify stored logs in a time range (epoch seconds or ISO-8601)"""
+    if not integrity_log:
+        return jsonify({'error': 'Integrity log is disabled'}), 404
+    
+    try:
+        from_ts = parse_timestamp(request.args.get('from'))
+        to_ts = parse_timestamp(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': f"Invalid time range: {e}"}), 400
+    
+    def verify():
+        integrity_log.flush()
+        return integrity_log.verify_range(from_ts, to_ts)
+    
+    try:
+        return jsonify(run_blocking(verify))
+    except Exception as e:
+        logger.error(f"Integrity verification error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rules', methods=['GET'])
+def get_rules():
+    """Describe the active rule set"""
+    return jsonify(rule_engine.describe())
+
+@app.route('/api/rules/reload', methods=['POST'])
+def reload_rules():
+    """Reload the rule file without restarting capture"""
+    changed = rule_engine.reload()
+    return jsonify({'status': 'success', 'reloaded': changed, 'rules': rule_engine.describe()})
+
+@app.route('/api/keys', methods=['GET'])
+def get_keys():
+    """List keystore metadata"""
+    return jsonify(key_manager.list_keys())
+
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+def handle_profile():
+    """Start a time-boxed profile, or fetch the latest one
+
+    POST {mode: sampling|scoring, duration, interval} starts a run in the
+    background; GET returns its status and output (collapsed stacks as
+    text/plain with ?format=collapsed). When SNM_PROFILE_TOKEN is set,
+    both require it in the X-Profile-Token header.
+    """
+    global profile_session
+    
+    if not config.profiling_enabled:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    token = os.environ.get(TOKEN_ENV)
+    if token and not hmac.compare_digest(request.headers.get('X-Profile-Token', ''), token):
+        return jsonify({'error': 'Invalid profiling token'}), 401
+    
+    if request.method == 'GET':
+        session = profile_session
+        if not session:
+            return jsonify({'status': 'idle'})
+        if request.args.get('format') == 'collapsed':
+            if session.running or session.mode != 'sampling':
+                return jsonify({'error': 'No finished sampling profile'}), 409
+            return app.response_class(session.output or '', mimetype='text/plain')
+        return jsonify(session.status())
+    
+    if profile_session and profile_session.running:
+        return jsonify({'error': 'A profile is already running', 'profile': profile_session.status(False)}), 409
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        duration = min(float(data.get('duration', 10)), config.profile_max_duration)
+        interval = float(data.get('interval', config.profile_interval))
+        if duration <= 0 or interval <= 0:
+            raise ValueError("duration and interval must be positive")
+        profile_session = ProfileSession(
+            data.get('mode', 'sampling'),
+            duration,
+            interval=interval,
+            target=anomaly_detector
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    profile_session.start()
+    return jsonify({'status': 'started', 'profile': profile_session.status(False)}), 202
+
+@app.route('/api/keys/rotate', methods=['POST'])
+def rotate_keys():
+    """Rotate the active key for the current (or given) algorithm"""
+    try:
+        data = request.get_json(silent=True) or {}
+        algorithm = data.get('algorithm', config.encryption_algorithm)
+        key_id, _ = run_blocking(key_manager.rotate, algorithm)  # RSA keygen when the pool is empty
+        if algorithm == config.encryption_algorithm:
+            schedule_rebuild('encryption_manager')
+        return jsonify({'status': 'success', 'algorithm': algorithm, 'key_id': key_id})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
 @app.route('/api/export', methods=['POST'])
 def export_logs():
     """Export captured logs with encryption"""
     try:
         data = request.get_json()
         logs = data.get('logs', [])
-        format_type = data.get('format', 'json')  # json or csv
+        format_type = data.get('format', 'json')  # json, csv, ndjson, columnar, arrow, parquet, npz
+        compression = data.get('compression')  # none, gzip, zstd
+        if compression is None:
+            # The configured default only applies where the format supports it
+            compression = config.export_compression
+            if compression not in supported_compressions(format_type):
+                compression = 'none'
+        level = data.get('compression_level', config.export_compression_level)
         
         if not logs:
             return jsonify({'error': 'No logs to export'}), 400
         
-        # Prepare data
-        if format_type == 'json':
-            export_data = json.dumps(logs, indent=2)
-            filename = f"network_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        else:
-            # Convert to CSV format
-            import pandas as pd
-            df = pd.DataFrame(logs)
-            export_data = df.to_csv(index=False)
-            filename = f"network_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        # Serialize and compress before encrypting (ciphertext doesn't compress)
+        export_data, format_type, compression, extension = run_blocking(
+            encode_logs, logs, format_type, compression, level
+        )
+        filename = f"network_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
         
         # Encrypt data
-        if encryption_manager:
-            encrypted_data = encryption_manager.encrypt(export_data.encode())
-            filename = filename.replace('.', '_encrypted.')
+        manager = encryption_manager
+        if manager:
+            encrypted_data = run_blocking(manager.encrypt, export_data)
+            filename = filename.replace('.', '_encrypted.', 1)
         else:
-            encrypted_data = export_data.encode()
+            encrypted_data = export_data
         
         # Return encrypted data as base64
         import base64
@@ -153,9 +584,15 @@ def export_logs():
             'status': 'success',
             'filename': filename,
             'data': encoded_data,
-            'encrypted': encryption_manager is not None
+            'format': format_type,
+            'compression': compression,
+            'key_id': manager.key_id if manager else None,
+            'encrypted': manager is not None
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
     except Exception as e:
         logger.error(f"Export error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -163,14 +600,59 @@ def export_logs():
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
+    global connected_clients
+    
+    with client_lock:
+        if connected_clients >= config.max_clients:
+            logger.warning(f"Rejecting client {request.sid}: {connected_clients} clients connected")
+            return False
+        connected_clients += 1
+    
     logger.info(f"Client connected: {request.sid}")
-    emit('connected', {'status': 'connected', 'timestamp': datetime.now().isoformat()})
+    emit('connected', {
+        'status': 'connected',
+        'timestamp': datetime.now().isoformat(),
+        'stream': replay_buffer.position()
+    })
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
+    global connected_clients
+    
+    with client_lock:
+        connected_clients = max(connected_clients - 1, 0)
     logger.info(f"Client disconnected: {request.sid}")
 
+@socketio.on('resume')
+def handle_resume(data=None):
+    """Replay events a reconnecting client missed after its last sequence"""
+    data = data or {}
+    try:
+        last_seq = int(data.get('last_seq'))
+    except (TypeError, ValueError):
+        emit('replay_error', {'error': 'last_seq is required'})
+        return
+    
+    events = replay_buffer.since(last_seq, data.get('stream_id'))
+    if events is None:
+        # Too far behind (or a restarted server): start over from a rollup
+        emit('replay_gap', {
+            'last_seq': last_seq,
+            'stream': replay_buffer.position(),
+            'rollup': replay_buffer.rollup(),
+            'alerts': alert_aggregator.stats() if alert_aggregator else None
+        })
+        return
+    
+    batch_size = config.replay_batch_size
+    for start in range(0, len(events), batch_size):
+        emit('replay', {
+            'events': [{'seq': seq, 'event': event, 'data': payload}
+                       for seq, event, payload in events[start:start + batch_size]]
+        })
+    emit('replay_complete', {'last_seq': last_seq, 'replayed': len(events), 'stream': replay_buffer.position()})
+
 @socketio.on('start_capture')
 def handle_start_capture(data=None):
     """Start packet capture"""
@@ -205,6 +687,11 @@ def handle_stop_capture():
             packet_capture.stop_capture()
             packet_capture = None
         
+        if integrity_log:
+            integrity_log.flush()
+        if alert_aggregator:
+            alert_aggregator.flush()
+        
         emit('capture_status', {'status': 'stopped', 'timestamp': datetime.now().isoformat()})
         logger.info("Packet capture stopped")
         
@@ -216,30 +703,178 @@ def handle_stop_capture():
 def handle_update_config(data):
     """Update configuration via WebSocket"""
     try:
-        config.update(data)
-        
-        # Reinitialize components if needed
-        if any(key in data for key in ['ml_model', 'feature_level', 'encryption_algorithm']):
-            initialize_components()
+        changed, rebuilding, requires_restart = apply_config(data)
         
-        emit('config_updated', {'status': 'success', 'config': config.to_dict()})
+        emit('config_updated', {
+            'status': 'success',
+            'config': config.to_dict(),
+            'changed': sorted(changed),
+            'rebuilding': rebuilding,
+            'requires_restart': requires_restart
+        })
         logger.info("Configuration updated via WebSocket")
         
     except Exception as e:
         emit('config_error', {'error': str(e)})
         logger.error(f"Config update error: {e}")
 
+def collector_callback(packets):
+    """Score a drained collector batch, evaluating the rules over it in one pass"""
+    detector = anomaly_detector
+    pending = [p for p in packets if not p.get('scored_locally')]
+    results = {}
+    if pending and (detector is None or detector.uses_rules):
+        try:
+            results = dict(zip(map(id, pending), rule_engine.evaluate_packets(pending)))
+        except Exception as e:
+            logger.error(f"Batch rule evaluation error: {e}")
+    for packet_data in packets:
+        packet_callback(packet_data, results.get(id(packet_data)))
+
+def start_collector():
+    """Accept packet batches from sensor agents and feed them to packet_callback"""
+    global collector
+    collector = CollectorServer(
+        config.collector_address,
+        collector_callback,
+        queue_size=config.collector_queue_size,
+        secret=os.environ.get(SECRET_ENV)
+    )
+    collector.start()
+
+def run_agent():
+    """Headless sensor: capture, optionally score, and ship batches to the collector"""
+    interfaces = config.network_interfaces
+    agent = SensorAgent(
+        config.collector_address,
+        agent_id=config.agent_id or None,
+        batch_size=config.agent_batch_size,
+        flush_interval=config.agent_flush_interval,
+        spool_batches=config.agent_spool_batches,
+        compression_level=config.agent_compression_level,
+        interfaces=interfaces,
+        max_in_flight=config.agent_max_in_flight,
+        ack_timeout=config.agent_ack_timeout,
+        secret=os.environ.get(SECRET_ENV)
+    )
+    detector = build_detector() if config.agent_local_scoring else None
+    
+    def agent_callback(packet_data):
+        try:
+            if detector:
+                score_packet(detector, packet_data)
+                packet_data['scored_locally'] = True
+            agent.submit(packet_data)
+        except Exception as e:
+            logger.error(f"Error processing packet: {e}")
+    
+    capture = MultiInterfaceCapture(
+        interfaces,
+        callback=agent_callback,
+        queue_size=config.interface_queue_size,
+        merge_delay=config.merge_delay,
+        bpf_filter=config.capture_filter,
+        snaplen=config.snaplen,
+        capture_mode=config.capture_mode
+    )
+    
+    agent.start()
+    try:
+        logger.info(f"Sensor agent capturing on interfaces: {', '.join(interfaces)}")
+        capture.start_capture()
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.stop_capture()
+        agent.stop()
+        logger.info(f"Sensor agent stopped: {agent.get_stats()}")
+
+def configure_server(production=None):
+    """Bind Socket.IO to the app for the development or production serving mode"""
+    if production is None:
+        production = config.server_mode == 'production'
+    
+    if production:
+        # Emits come only from the emitter task, so the capture and scoring
+        # threads stay real OS threads and eventlet doesn't monkey-patch them
+        socketio.init_app(
+            app,
+            cors_allowed_origins=ALLOWED_ORIGINS,
+            async_mode=config.async_mode or 'eventlet',
+            logger=False,
+            engineio_logger=False
+        )
+    else:
+        socketio.init_app(
+            app,
+            cors_allowed_origins=ALLOWED_ORIGINS,
+            async_mode=config.async_mode,
+            logger=True,
+            engineio_logger=True
+        )
+    return production
+
+def run_server(production=None, host=None, port=None):
+    """Start the emitter task and serve the API and WebSocket"""
+    production = configure_server(production)
+    emitter.start()
+    
+    host = host or config.server_host
+    port = port or config.server_port
+    if production:
+        logger.info(f"Serving in production mode ({socketio.async_mode}) on {host}:{port}")
+        options = {'max_size': config.server_pool_size} if socketio.async_mode == 'eventlet' else {}
+        socketio.run(app, host=host, port=port, log_output=False, **options)
+    else:
+        socketio.run(
+            app,
+            host=host,
+            port=port,
+            debug=True,
+            allow_unsafe_werkzeug=True
+        )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Smart Network Monitor Backend")
+    parser.add_argument('--mode', choices=['standalone', 'collector', 'agent'],
+                        help="standalone (default), collector for sensor agents, or headless agent")
+    parser.add_argument('--collector', help="collector address, host:port or unix:/path")
+    parser.add_argument('--agent-id', help="agent name reported to the collector (default: hostname)")
+    parser.add_argument('--interface', help="capture interface(s), comma-separated")
+    parser.add_argument('--production', action='store_true',
+                        help="serve with eventlet, without debug mode or per-frame logging")
+    parser.add_argument('--profiling', action='store_true',
+                        help="expose /api/admin/profile for this run")
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
+    # Command-line overrides apply to this process only and aren't saved
+    if args.mode:
+        config.override('mode', args.mode)
+    if args.collector:
+        config.override('collector_address', args.collector)
+    if args.agent_id:
+        config.override('agent_id', args.agent_id)
+    if args.interface:
+        config.override('network_interface', args.interface)
+    if args.profiling:
+        config.override('profiling_enabled', True)
+    
+    if config.mode == 'agent':
+        logger.info("Starting Smart Network Monitor sensor agent")
+        run_agent()
+        raise SystemExit(0)
+    
     logger.info("Starting Smart Network Monitor Backend")
     
     # Initialize components
     initialize_components()
     
+    if config.mode == 'collector':
+        start_collector()
+    
     # Start the server
-    socketio.run(
-        app,
-        host='127.0.0.1',
-        port=5000,
-        debug=True,
-        allow_unsafe_werkzeug=True
-    )
\ No newline at end of file
+    run_server(production=True if args.production else None)
\ No newline at end of file
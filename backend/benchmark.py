@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Smart Network Monitor Benchmarks
+
+Standalone throughput benchmarks for backend components. Each benchmark
+prints a small table to stdout; run with --help for the available suites.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def _payload(total_bytes, block_size):
+    """Yield total_bytes of data in block_size pieces without holding it all"""
+    block = os.urandom(block_size)
+    remaining = total_bytes
+    while remaining > 0:
+        piece = block if remaining >= block_size else block[:remaining]
+        remaining -= len(piece)
+        yield piece
+
+
+def bench_encryption(args):
+    """Measure encrypt_stream/decrypt_stream throughput"""
+    from encryption import EncryptionManager
+
+    total = args.size_mb * 1024 * 1024
+    print(f"Streaming AEAD throughput on {args.size_mb} MB payloads")
+    print(f"{'algorithm':<10} {'workers':>7} {'chunk KB':>8} {'encrypt MB/s':>13} {'decrypt MB/s':>13}")
+
+    for algorithm in ['AES-256', 'RSA']:
+        manager = EncryptionManager(algorithm)
+        for workers in args.workers:
+            # Encrypt, keeping only a bounded tail of the ciphertext in memory
+            start = time.perf_counter()
+            frames = []
+            for frame in manager.encrypt_stream(_payload(total, args.chunk_kb * 1024),
+                                                chunk_size=args.chunk_kb * 1024,
+                                                workers=workers):
+                frames.append(frame)
+                if len(frames) > 64:
+                    del frames[1:-1]  # keep the header, drop the body
+            encrypt_seconds = time.perf_counter() - start
+
+            # Decrypt a smaller sample so the ciphertext can be replayed
+            sample = b''.join(manager.encrypt_stream(_payload(min(total, 64 * 1024 * 1024), 1024 * 1024),
+                                                     chunk_size=args.chunk_kb * 1024))
+            start = time.perf_counter()
+            decrypted = sum(len(chunk) for chunk in manager.decrypt_stream([sample]))
+            decrypt_seconds = time.perf_counter() - start
+
+            print(f"{algorithm:<10} {workers:>7} {args.chunk_kb:>8} "
+                  f"{total / encrypt_seconds / 1e6:>13.1f} {decrypted / decrypt_seconds / 1e6:>13.1f}")
+
+
+def _demo_packets(count, seed=42):
+    """Generate packets shaped like PacketCapture output"""
+    import random
+    import uuid
+    from datetime import datetime, timedelta
+
+    rng = random.Random(seed)
+    protocols = ['TCP', 'UDP', 'HTTP', 'HTTPS', 'DNS', 'ICMP']
+    ips = ['192.168.1.100', '192.168.1.101', '10.0.0.1', '8.8.8.8',
+           '1.1.1.1', '192.168.1.1', '172.16.0.1', '203.0.113.1']
+    start = datetime(2024, 1, 1)
+    packets = []
+    for i in range(count):
+        length = rng.randint(64, 1500) if rng.random() > 0.05 else rng.randint(8000, 9000)
+        packets.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'timestamp': (start + timedelta(milliseconds=i)).isoformat(),
+            'source_ip': rng.choice(ips),
+            'destination_ip': rng.choice(ips),
+            'protocol': rng.choice(protocols),
+            'length': length,
+            'is_anomaly': length > 8000,
+            'anomaly_score': 0.5 if length > 8000 else 0.0
+        })
+    return packets
+
+
+def bench_export(args):
+    """Compare export format size and encode time"""
+    from export_formats import encode_logs, available_formats, zstandard
+
+    logs = _demo_packets(args.packets)
+    cases = [('json', 'none'), ('csv', 'none'), ('ndjson', 'none'), ('ndjson', 'gzip')]
+    if zstandard is not None:
+        cases.append(('ndjson', 'zstd'))
+    cases.append(('npz', 'none'))
+    if 'parquet' in available_formats():
+        cases.extend([('arrow', 'none'), ('parquet', 'none'), ('parquet', 'zstd')])
+
+    print(f"Export size and encode time for {args.packets} packets")
+    print(f"{'format':<10} {'compression':<11} {'size KB':>10} {'vs json':>8} {'encode ms':>10}")
+    baseline = None
+    for format_type, compression in cases:
+        start = time.perf_counter()
+        data, _, _, _ = encode_logs(logs, format_type, compression)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or len(data)
+        print(f"{format_type:<10} {compression:<11} {len(data) / 1024:>10.1f} "
+              f"{len(data) / baseline:>8.3f} {elapsed * 1000:>10.1f}")
+
+
+def _load_packets(args):
+    """Replay packets from --replay (JSON array or NDJSON export) or synthesize them"""
+    import json
+
+    if not args.replay:
+        return _demo_packets(args.packets)
+    with open(args.replay, 'r') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _trained_detector(packets, model_type):
+    from ml_models import AnomalyDetector
+
+    detector = AnomalyDetector(model_type=model_type)
+    detector.train_models(packets[:min(len(packets), 5000)])
+    return detector
+
+
+def bench_cache(args):
+    """Measure prediction cache hit rate, throughput and agreement under adaptive thresholds"""
+    packets = _load_packets(args)
+    detector = _trained_detector(packets, args.model)
+
+    # As in the default config; each run starts from fresh estimators so verdicts are comparable
+    detector.configure_thresholds(True)
+    start = time.perf_counter()
+    baseline = [detector.predict(p) for p in packets]
+    baseline_seconds = time.perf_counter() - start
+
+    print(f"Prediction cache on {len(packets)} packets ({args.model})")
+    print(f"{'bucket':>7} {'pps':>10} {'speedup':>8} {'hit rate':>9} {'agree':>7} {'evictions':>10}")
+    print(f"{'off':>7} {len(packets) / baseline_seconds:>10.0f} {1.0:>8.2f} {'-':>9} {1.0:>7.4f} {'-':>10}")
+    for bucket in args.buckets:
+        detector.configure_cache(args.cache_size, bucket)
+        detector.configure_thresholds(True)
+        start = time.perf_counter()
+        results = [detector.predict(p) for p in packets]
+        elapsed = time.perf_counter() - start
+        stats = detector.cache_stats()
+        agree = sum(a[0] == b[0] for a, b in zip(results, baseline)) / len(packets)
+        print(f"{bucket:>7} {len(packets) / elapsed:>10.0f} {baseline_seconds / elapsed:>8.2f} "
+              f"{stats['hit_rate']:>9.3f} {agree:>7.4f} {stats['evictions']:>10}")
+
+
+def bench_cascade(args):
+    """Compare the cascade against the full ensemble"""
+    packets = _load_packets(args)
+    ensemble = _trained_detector(packets, 'both')
+
+    start = time.perf_counter()
+    baseline = [ensemble.predict(p) for p in packets]
+    baseline_seconds = time.perf_counter() - start
+
+    print(f"Cascade vs full ensemble on {len(packets)} packets")
+    print(f"{'margins':>9} {'pps':>9} {'speedup':>8} {'agree':>7} {'missed':>7} {'reach IF':>9} {'reach AE':>9}")
+    print(f"{'both':>9} {len(packets) / baseline_seconds:>9.0f} {1.0:>8.2f} {1.0:>7.4f} {0:>7} {1.0:>9.3f} {1.0:>9.3f}")
+
+    cascade = ensemble.reconfigure('cascade', ensemble.feature_level)
+    for margin in args.margins:
+        cascade.configure_cascade(normal_margin=margin, anomaly_margin=margin)
+        start = time.perf_counter()
+        results = [cascade.predict(p) for p in packets]
+        elapsed = time.perf_counter() - start
+        reached = cascade.cascade_stats()['reached']
+        agree = sum(a[0] == b[0] for a, b in zip(results, baseline)) / len(packets)
+        missed = sum(b[0] and not a[0] for a, b in zip(results, baseline))
+        print(f"{margin:>9.3f} {len(packets) / elapsed:>9.0f} {baseline_seconds / elapsed:>8.2f} {agree:>7.4f} "
+              f"{missed:>7} {reached['isolation_forest']:>9.3f} {reached['autoencoder']:>9.3f}")
+
+
+def bench_capture(args):
+    """Measure packets/second delivered by each capture mode on a live interface"""
+    import threading
+    from packet_capture import PacketCapture
+
+    print(f"Capture throughput on {args.interface} for {args.duration}s per mode"
+          + (f" (filter: {args.bpf})" if args.bpf else ""))
+    print(f"{'mode':<6} {'packets':>9} {'pps':>10} {'note':<10}")
+    for mode in ['full', 'lean']:
+        count = [0]
+        lock = threading.Lock()
+
+        def callback(packet_data):
+            with lock:
+                count[0] += 1
+
+        capture = PacketCapture(args.interface, callback, bpf_filter=args.bpf,
+                                snaplen=args.snaplen, capture_mode=mode)
+        capture.start_capture()
+        time.sleep(args.duration)
+        capture.stop_capture()
+        note = 'demo' if capture.demo_mode else ''
+        print(f"{mode:<6} {count[0]:>9} {count[0] / args.duration:>10.0f} {note:<10}")
+
+
+def bench_emit(args):
+    """Measure Socket.IO emit throughput and latency with 1..N connected clients"""
+    import socket
+    import threading
+    import socketio as socketio_client
+    import app as backend
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = threading.Thread(target=backend.run_server, kwargs={'production': True, 'port': port}, daemon=True)
+    server.start()
+    time.sleep(2)
+    url = f"http://127.0.0.1:{port}"
+
+    print(f"Emit throughput at {args.emit_rate} events/s for {args.duration}s ({backend.socketio.async_mode})")
+    print(f"{'clients':>7} {'events':>8} {'delivered':>10} {'deliv/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'dropped':>8}")
+    for count in args.clients:
+        lock = threading.Lock()
+        latencies = []
+        clients = []
+        for _ in range(count):
+            # The server checks Origin on websocket upgrades; present the frontend's
+            client = socketio_client.Client(websocket_extra_options={'origin': backend.ALLOWED_ORIGINS[0]})
+
+            @client.on('events')
+            def on_events(data):
+                now = time.time()
+                delays = [now - item['data']['sent_at'] for item in data['events']
+                          if item['event'] == 'packet_captured']
+                with lock:
+                    latencies.extend(delays)
+
+            client.connect(url, transports=['websocket'])
+            clients.append(client)
+
+        dropped_before = backend.emitter.stats()['dropped']
+        total = int(args.emit_rate * args.duration)
+        started = time.perf_counter()
+        for i in range(total):
+            backend.emitter.put('packet_captured', {'id': i, 'sent_at': time.time()})
+            # Pace the producer at emit_rate
+            ahead = (i + 1) / args.emit_rate - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+        # Wait for deliveries to drain (bounded)
+        expected = total * count
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            with lock:
+                if len(latencies) >= expected:
+                    break
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - started
+
+        with lock:
+            received = sorted(latencies)
+        for client in clients:
+            client.disconnect()
+        dropped = backend.emitter.stats()['dropped'] - dropped_before
+        p50 = received[len(received) // 2] * 1000 if received else 0.0
+        p99 = received[int(len(received) * 0.99)] * 1000 if received else 0.0
+        print(f"{count:>7} {total:>8} {len(received):>10} {len(received) / elapsed:>10.0f} "
+              f"{p50:>8.2f} {p99:>8.2f} {dropped:>8}")
+        time.sleep(1)
+
+
+def bench_sensors(args):
+    """Ship packets from N loopback sensor agents to a collector that is restarted mid-run"""
+    import threading
+    from collections import Counter
+    from sensor import SensorAgent, CollectorServer
+
+    print(f"Sensor delivery over loopback: {args.agent_packets} packets per agent in {args.duration}s, "
+          f"{args.restarts} collector restart(s)")
+    print(f"{'agents':>6} {'sent':>9} {'received':>9} {'dupes':>7} {'lost':>7} {'resent':>7} {'pps':>9}")
+    for count in args.agents:
+        lock = threading.Lock()
+        received = Counter()
+
+        def callback(packets):
+            with lock:
+                for packet_data in packets:
+                    received[(packet_data['agent'], packet_data['id'])] += 1
+
+        collector = CollectorServer('127.0.0.1:0', callback)
+        collector.start()
+        address = f"127.0.0.1:{collector.bound_address[1]}"
+        agents = [SensorAgent(address, agent_id=f"agent-{i}", batch_size=500, flush_interval=0.05,
+                              spool_batches=100000, ack_timeout=2.0)
+                  for i in range(count)]
+
+        def produce(agent):
+            # Spread submissions evenly over the run so restarts land mid-stream
+            step = 100
+            started = time.perf_counter()
+            for i in range(0, args.agent_packets, step):
+                for packet_id in range(i, min(i + step, args.agent_packets)):
+                    agent.submit({'id': packet_id, 'length': 60, 'protocol': 'TCP'})
+                ahead = (i + step) / args.agent_packets * args.duration - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        started = time.perf_counter()
+        for agent in agents:
+            agent.start()
+        producers = [threading.Thread(target=produce, args=(agent,)) for agent in agents]
+        for producer in producers:
+            producer.start()
+        for restart in range(args.restarts):
+            time.sleep(args.duration / (args.restarts + 1))
+            collector.stop()
+            time.sleep(0.5)
+            collector = CollectorServer(address, callback)
+            collector.start()
+        for producer in producers:
+            producer.join()
+        for agent in agents:
+            agent.stop(timeout=30)
+        collector.stop()
+        elapsed = time.perf_counter() - started
+
+        sent = count * args.agent_packets
+        with lock:
+            unique = len(received)
+            total = sum(received.values())
+        resent = sum(agent.get_stats()['resent_batches'] for agent in agents)
+        print(f"{count:>6} {sent:>9} {total:>9} {total - unique:>7} {sent - unique:>7} {resent:>7} "
+              f"{unique / elapsed:>9.0f}")
+
+
+SUITES = {
+    'encryption': bench_encryption,
+    'export': bench_export,
+    'cache': bench_cache,
+    'cascade': bench_cascade,
+    'capture': bench_capture,
+    'emit': bench_emit,
+    'sensors': bench_sensors,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('suites', nargs='*', default=list(SUITES), choices=list(SUITES))
+    parser.add_argument('--size-mb', type=int, default=1024, help='payload size for throughput runs')
+    parser.add_argument('--chunk-kb', type=int, default=64, help='stream chunk size')
+    parser.add_argument('--packets', type=int, default=200000, help='packets per export run')
+    parser.add_argument('--replay', help='JSON/NDJSON packet export to replay instead of synthetic traffic')
+    parser.add_argument('--model', default='isolation_forest', help='model_type for scoring suites')
+    parser.add_argument('--cache-size', type=int, default=10000, help='prediction cache entries')
+    parser.add_argument('--buckets', type=int, nargs='+', default=[1, 16, 64, 256], help='length bucket widths')
+    parser.add_argument('--margins', type=float, nargs='+', default=[0.02, 0.05, 0.1], help='cascade band margins')
+    parser.add_argument('--interface', default='eth0', help='interface for the capture suite')
+    parser.add_argument('--bpf', default=None, help='BPF capture filter for the capture suite')
+    parser.add_argument('--snaplen', type=int, default=None, help='snapshot length for the capture suite')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per capture mode, emit or sensors run')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 50], help='connected clients per emit run')
+    parser.add_argument('--emit-rate', type=float, default=1000, help='events/second offered to the emitter')
+    parser.add_argument('--agents', type=int, nargs='+', default=[1, 4, 16], help='sensor agents per sensors run')
+    parser.add_argument('--agent-packets', type=int, default=50000, help='packets each agent ships')
+    parser.add_argument('--restarts', type=int, default=1, help='collector restarts during a sensors run')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='parallel encryption workers')
+    args = parser.parse_args()
+
+    for name in args.suites:
+        SUITES[name](args)
+        print()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,91 @@
 import json
 import os
+import atexit
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Config:
-    def __init__(self, config_file='config.json'):
+    def __init__(self, config_file='config.json', save_delay=1.0):
         self.config_file = config_file
+        self.save_delay = save_delay
+        self.lock = threading.Lock()
+        self._save_timer = None
+        self.overrides = {}  # key -> saved value, for values set for this process only
         self.data = {
             'network_interface': 'eth0',
             'buffer_size': 1000,
             'analysis_depth': 'intermediate',
             'ml_model': 'both',
             'feature_level': 'standard',
-            'encryption_algorithm': 'AES-256'
+            'encryption_algorithm': 'AES-256',
+            'export_compression': 'none',
+            'export_compression_level': None,
+            'integrity_enabled': True,
+            'integrity_dir': 'integrity',
+            'integrity_chunk_packets': 500,
+            'integrity_segment_chunks': 1024,
+            'integrity_retention_segments': 100,
+            'keystore_dir': 'keystore',
+            'rsa_pool_size': 2,
+            'prediction_cache_size': 0,
+            'prediction_cache_length_bucket': 64,
+            'cascade_rule_threshold': 0.5,
+            'cascade_normal_margin': 0.05,
+            'cascade_anomaly_margin': 0.05,
+            'rules_file': 'rules.json',
+            'rules_reload_interval': 2.0,
+            'adaptive_thresholds': True,
+            'target_alert_rate': 0.01,
+            'threshold_window': 10000,
+            'threshold_buckets': 10,
+            'capture_mode': 'lean',
+            'capture_filter': '',
+            'snaplen': 0,
+            'interface_queue_size': 10000,
+            'merge_delay': 0.05,
+            'link_monitor_enabled': True,
+            'link_monitor_interval': 0.1,
+            'link_monitor_history': 600,
+            'link_monitor_emit_interval': 1.0,
+            'sampling_enabled': True,
+            'sampling_target_utilization': 0.8,
+            'sampling_min_ratio': 0.01,
+            'sampling_adjust_interval': 1.0,
+            'mode': 'standalone',
+            'collector_address': '127.0.0.1:5600',
+            'collector_queue_size': 100000,
+            'agent_id': '',
+            'agent_batch_size': 500,
+            'agent_flush_interval': 0.5,
+            'agent_spool_batches': 1000,
+            'agent_compression_level': 6,
+            'agent_max_in_flight': 8,
+            'agent_ack_timeout': 10.0,
+            'agent_local_scoring': False,
+            'alerts_enabled': True,
+            'alert_window': 5.0,
+            'alert_group_by': ['source_ip', 'destination_ip', 'protocol', 'detector', 'rules'],
+            'alert_max_groups': 10000,
+            'replay_buffer_size': 10000,
+            'replay_max_gap': 5000,
+            'replay_batch_size': 1000,
+            'server_mode': 'development',
+            'server_host': '127.0.0.1',
+            'server_port': 5000,
+            'async_mode': None,
+            'max_clients': 100,
+            'server_pool_size': 1000,
+            'emit_queue_size': 10000,
+            'emit_batch_size': 256,
+            'profiling_enabled': False,
+            'profile_max_duration': 60,
+            'profile_interval': 0.005
         }
         
         self.load_config()
+        atexit.register(self.flush)
     
     def load_config(self):
         """Load configuration from file"""
@@ -32,27 +101,78 @@ class Config:
             logger.error(f"Error loading config: {e}")
     
     def save_config(self):
-        """Save configuration to file"""
+        """Save configuration to file atomically"""
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(self.data, f, indent=2)
+            with self.lock:
+                self._save_timer = None
+                payload = json.dumps(dict(self.data, **self.overrides), indent=2)
+            
+            # Write a sibling temp file and rename so readers never see a partial file
+            tmp_file = f"{self.config_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.config_file)
             logger.info(f"Configuration saved to {self.config_file}")
         except Exception as e:
             logger.error(f"Error saving config: {e}")
     
     def update(self, new_data):
-        """Update configuration with new data"""
-        self.data.update(new_data)
-        self.save_config()
+        """Update configuration with new data, returning the keys that changed"""
+        with self.lock:
+            changed = {k: v for k, v in new_data.items() if self.data.get(k) != v}
+            self.data.update(changed)
+            # An explicit update replaces a process-only override and is saved
+            released = [k for k in new_data if k in self.overrides]
+            for k in released:
+                del self.overrides[k]
+        
+        if changed or released:
+            self._schedule_save()
+        return changed
+    
+    def override(self, key, value):
+        """Set a value for this process only, e.g. from the command line; it is never saved"""
+        with self.lock:
+            if key not in self.overrides:
+                self.overrides[key] = self.data.get(key)
+            self.data[key] = value
+    
+    def _schedule_save(self):
+        """Debounce saves so bursts of updates cause a single write"""
+        with self.lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self.save_config)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def flush(self):
+        """Write any pending debounced save immediately"""
+        with self.lock:
+            timer = self._save_timer
+        if timer is not None:
+            timer.cancel()
+            self.save_config()
     
     def to_dict(self):
         """Return configuration as dictionary"""
-        return self.data.copy()
+        with self.lock:
+            return self.data.copy()
     
     @property
     def network_interface(self):
         return self.data['network_interface']
     
+    @property
+    def network_interfaces(self):
+        """network_interface as a list; accepts a list or a comma-separated string"""
+        value = self.data['network_interface']
+        if isinstance(value, str):
+            return [name.strip() for name in value.split(',') if name.strip()]
+        return list(value)
+    
     @property
     def buffer_size(self):
         return self.data['buffer_size']
@@ -71,4 +191,252 @@ class Config:
     
     @property
     def encryption_algorithm(self):
-        return self.data['encryption_algorithm']
\ No newline at end of file
+        return self.data['encryption_algorithm']
+    
+    @property
+    def export_compression(self):
+        return self.data['export_compression']
+    
+    @property
+    def export_compression_level(self):
+        return self.data['export_compression_level']
+    
+    @property
+    def integrity_enabled(self):
+        return self.data['integrity_enabled']
+    
+    @property
+    def integrity_dir(self):
+        return self.data['integrity_dir']
+    
+    @property
+    def integrity_chunk_packets(self):
+        return self.data['integrity_chunk_packets']
+    
+    @property
+    def integrity_segment_chunks(self):
+        return self.data['integrity_segment_chunks']
+    
+    @property
+    def integrity_retention_segments(self):
+        return self.data['integrity_retention_segments']
+    
+    @property
+    def keystore_dir(self):
+        return self.data['keystore_dir']
+    
+    @property
+    def rsa_pool_size(self):
+        return self.data['rsa_pool_size']
+    
+    @property
+    def prediction_cache_size(self):
+        return self.data['prediction_cache_size']
+    
+    @property
+    def prediction_cache_length_bucket(self):
+        return self.data['prediction_cache_length_bucket']
+    
+    @property
+    def cascade_rule_threshold(self):
+        return self.data['cascade_rule_threshold']
+    
+    @property
+    def cascade_normal_margin(self):
+        return self.data['cascade_normal_margin']
+    
+    @property
+    def cascade_anomaly_margin(self):
+        return self.data['cascade_anomaly_margin']
+    
+    @property
+    def rules_file(self):
+        return self.data['rules_file']
+    
+    @property
+    def rules_reload_interval(self):
+        return self.data['rules_reload_interval']
+    
+    @property
+    def adaptive_thresholds(self):
+        return self.data['adaptive_thresholds']
+    
+    @property
+    def target_alert_rate(self):
+        return self.data['target_alert_rate']
+    
+    @property
+    def threshold_window(self):
+        return self.data['threshold_window']
+    
+    @property
+    def threshold_buckets(self):
+        return self.data['threshold_buckets']
+    
+    @property
+    def capture_mode(self):
+        return self.data['capture_mode']
+    
+    @property
+    def capture_filter(self):
+        return self.data['capture_filter']
+    
+    @property
+    def snaplen(self):
+        return self.data['snaplen']
+    
+    @property
+    def interface_queue_size(self):
+        return self.data['interface_queue_size']
+    
+    @property
+    def merge_delay(self):
+        return self.data['merge_delay']
+    
+    @property
+    def link_monitor_enabled(self):
+        return self.data['link_monitor_enabled']
+    
+    @property
+    def link_monitor_interval(self):
+        return self.data['link_monitor_interval']
+    
+    @property
+    def link_monitor_history(self):
+        return self.data['link_monitor_history']
+    
+    @property
+    def link_monitor_emit_interval(self):
+        return self.data['link_monitor_emit_interval']
+    
+    @property
+    def sampling_enabled(self):
+        return self.data['sampling_enabled']
+    
+    @property
+    def sampling_target_utilization(self):
+        return self.data['sampling_target_utilization']
+    
+    @property
+    def sampling_min_ratio(self):
+        return self.data['sampling_min_ratio']
+    
+    @property
+    def sampling_adjust_interval(self):
+        return self.data['sampling_adjust_interval']
+    
+    @property
+    def mode(self):
+        return self.data['mode']
+    
+    @property
+    def collector_address(self):
+        return self.data['collector_address']
+    
+    @property
+    def collector_queue_size(self):
+        return self.data['collector_queue_size']
+    
+    @property
+    def agent_id(self):
+        return self.data['agent_id']
+    
+    @property
+    def agent_batch_size(self):
+        return self.data['agent_batch_size']
+    
+    @property
+    def agent_flush_interval(self):
+        return self.data['agent_flush_interval']
+    
+    @property
+    def agent_spool_batches(self):
+        return self.data['agent_spool_batches']
+    
+    @property
+    def agent_compression_level(self):
+        return self.data['agent_compression_level']
+    
+    @property
+    def agent_max_in_flight(self):
+        return self.data['agent_max_in_flight']
+    
+    @property
+    def agent_ack_timeout(self):
+        return self.data['agent_ack_timeout']
+    
+    @property
+    def agent_local_scoring(self):
+        return self.data['agent_local_scoring']
+    
+    @property
+    def alerts_enabled(self):
+        return self.data['alerts_enabled']
+    
+    @property
+    def alert_window(self):
+        return self.data['alert_window']
+    
+    @property
+    def alert_group_by(self):
+        return self.data['alert_group_by']
+    
+    @property
+    def alert_max_groups(self):
+        return self.data['alert_max_groups']
+    
+    @property
+    def replay_buffer_size(self):
+        return self.data['replay_buffer_size']
+    
+    @property
+    def replay_max_gap(self):
+        return self.data['replay_max_gap']
+    
+    @property
+    def replay_batch_size(self):
+        return self.data['replay_batch_size']
+    
+    @property
+    def server_mode(self):
+        return self.data['server_mode']
+    
+    @property
+    def server_host(self):
+        return self.data['server_host']
+    
+    @property
+    def server_port(self):
+        return self.data['server_port']
+    
+    @property
+    def async_mode(self):
+        return self.data['async_mode']
+    
+    @property
+    def max_clients(self):
+        return self.data['max_clients']
+    
+    @property
+    def server_pool_size(self):
+        return self.data['server_pool_size']
+    
+    @property
+    def emit_queue_size(self):
+        return self.data['emit_queue_size']
+    
+    @property
+    def emit_batch_size(self):
+        return self.data['emit_batch_size']
+    
+    @property
+    def profiling_enabled(self):
+        return self.data['profiling_enabled']
+    
+    @property
+    def profile_max_duration(self):
+        return self.data['profile_max_duration']
+    
+    @property
+    def profile_interval(self):
+        return self.data['profile_interval']
\ No newline at end of file
@@ -0,0 +1,86 @@
+import time
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SocketEmitter:
+    """Single emitter task between worker threads and Socket.IO
+
+    Capture, scoring and monitor threads call put(), which only appends to
+    a bounded thread-safe queue (events beyond queue_size are dropped and
+    counted, so a slow server never backs up capture). One background task
+    started through socketio.start_background_task drains the queue in
+    batches of up to batch_size and sends each drained batch as a single
+    'events' message ({'events': [{'event', 'data'}, ...]}, the shape of a
+    replay batch), so only that task ever touches the server and each
+    client gets one frame per drain instead of one per event. It polls
+    with socketio.sleep so it cooperates with eventlet's hub as well as
+    with threading mode.
+    """
+
+    def __init__(self, socketio, queue_size=10000, batch_size=256, idle_sleep=0.005):
+        self.socketio = socketio
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.lock = threading.Lock()
+        self.running = False
+        self.emitted = 0
+        self.dropped = 0
+        self.max_queue_delay = 0.0
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.socketio.start_background_task(self._emit_worker)
+        logger.info("Socket emitter started")
+
+    def stop(self):
+        self.running = False
+
+    def put(self, event, payload):
+        """Queue an event for the emitter task; safe from any thread"""
+        try:
+            self.queue.put_nowait((event, payload, time.monotonic()))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _emit_worker(self):
+        while self.running:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if not batch:
+                self.socketio.sleep(self.idle_sleep)
+                continue
+
+            now = time.monotonic()
+            try:
+                self.socketio.emit('events', {
+                    'events': [{'event': event, 'data': payload} for event, payload, _ in batch]
+                })
+            except Exception as e:
+                logger.error(f"Error emitting a batch of {len(batch)} events: {e}")
+            with self.lock:
+                self.emitted += len(batch)
+                self.max_queue_delay = max(self.max_queue_delay, now - batch[0][2])
+            self.socketio.sleep(0)  # let client I/O run between batches
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued': self.queue.qsize(),
+                'emitted': self.emitted,
+                'dropped': self.dropped,
+                'max_queue_delay': self.max_queue_delay
+            }
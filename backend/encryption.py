@@ -1,27 +1,107 @@
 import os
 import base64
 import hashlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Hybrid RSA envelope: magic, 2-byte wrapped key length, wrapped key, GCM nonce, ciphertext
+HYBRID_MAGIC = b'SNMH'
+LEGACY_SEPARATOR = b'|SEPARATOR|'
+
+# Streaming container layout (all integers big-endian):
+#   header: magic(4) version(1) key_mode(1) chunk_size(4) nonce_prefix(4)
+#           wrapped_key_len(2) wrapped_key(wrapped_key_len)
+#   frame:  final_flag(1) ciphertext_len(4) ciphertext(ciphertext_len)
+# Chunk i is sealed with AES-GCM under a per-stream data key, nonce
+# nonce_prefix || i (8 bytes), and AAD header || i || final_flag, so frames
+# cannot be reordered, dropped or truncated without failing authentication.
+# Key envelope prepended when a KeyManager is in use: magic, id length, key id
+KEY_MAGIC = b'SNMK'
+
+STREAM_MAGIC = b'SNMS'
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct('>4sBBIIH')
+STREAM_FRAME = struct.Struct('>BI')
+STREAM_KEY_AES = 1   # data key sealed with the manager's AES key
+STREAM_KEY_RSA = 2   # data key wrapped with RSA-OAEP
+DEFAULT_CHUNK_SIZE = 64 * 1024
+GCM_TAG_SIZE = 16
+
+
+class _StreamReader:
+    """Exact-length reads over a file object or an iterable of byte chunks"""
+
+    def __init__(self, source):
+        self._read = getattr(source, 'read', None)
+        self._iter = None if self._read else iter(source)
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def read(self, size):
+        """Read up to size bytes; fewer only at end of stream"""
+        if self._read:
+            parts = []
+            remaining = size
+            while remaining > 0:
+                block = self._read(remaining)
+                if not block:
+                    break
+                parts.append(block)
+                remaining -= len(block)
+            return b''.join(parts)
+
+        # Consume from the front with an offset; compact only once it is spent
+        while len(self._buffer) - self._offset < size:
+            try:
+                block = next(self._iter)
+            except StopIteration:
+                break
+            if isinstance(block, str):
+                block = block.encode('utf-8')
+            if self._offset:
+                del self._buffer[:self._offset]
+                self._offset = 0
+            self._buffer.extend(block)
+
+        data = bytes(self._buffer[self._offset:self._offset + size])
+        self._offset += len(data)
+        return data
+
+    def read_exact(self, size):
+        """Read exactly size bytes or raise on a truncated stream"""
+        data = self.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated encrypted stream")
+        return data
+
+
 class EncryptionManager:
-    def __init__(self, algorithm='AES-256'):
+    def __init__(self, algorithm='AES-256', key_manager=None, key_id=None):
         self.algorithm = algorithm
         self.private_key = None
         self.public_key = None
         self.aes_key = None
+        self.key_manager = key_manager
+        self.key_id = key_id
+        self._key_views = {}
         
         self._initialize_keys()
     
     def _initialize_keys(self):
         """Initialize encryption keys based on selected algorithm"""
         try:
-            if self.algorithm == 'RSA':
+            if self.key_manager and self.algorithm != 'SHA':
+                self._load_managed_key()
+            elif self.algorithm == 'RSA':
                 self._generate_rsa_keys()
             elif self.algorithm in ['AES-256', 'AES-192']:
                 self._generate_aes_key()
@@ -33,6 +113,42 @@ class EncryptionManager:
         except Exception as e:
             logger.error(f"Error initializing keys: {e}")
     
+    def _load_managed_key(self):
+        """Use the active (or a specific) key from the key manager"""
+        if self.key_id:
+            self.algorithm, key = self.key_manager.get_key(self.key_id)
+        else:
+            self.key_id, key = self.key_manager.active_key(self.algorithm)
+        
+        if self.algorithm == 'RSA':
+            self.private_key = key
+            self.public_key = key.public_key()
+        else:
+            self.aes_key = key
+    
+    def _key_view(self, key_id):
+        """Manager bound to an older key id, for decrypting earlier data"""
+        if not self.key_manager:
+            raise ValueError(f"Data was encrypted with key {key_id} but no keystore is configured")
+        if key_id not in self._key_views:
+            self._key_views[key_id] = EncryptionManager(key_manager=self.key_manager, key_id=key_id)
+        return self._key_views[key_id]
+    
+    def _key_envelope(self):
+        """Envelope identifying the key used, empty without a key manager"""
+        if not self.key_id:
+            return b''
+        key_id = self.key_id.encode('ascii')
+        return KEY_MAGIC + bytes([len(key_id)]) + key_id
+    
+    @staticmethod
+    def _split_key_envelope(data):
+        """Return (key_id, payload); key_id is None for unenveloped data"""
+        if data[:4] != KEY_MAGIC:
+            return None, data
+        length = data[4]
+        return data[5:5 + length].decode('ascii'), data[5 + length:]
+    
     def _generate_rsa_keys(self):
         """Generate RSA key pair"""
         self.private_key = rsa.generate_private_key(
@@ -56,9 +172,9 @@ class EncryptionManager:
                 data = data.encode('utf-8')
             
             if self.algorithm == 'RSA':
-                return self._encrypt_rsa(data)
+                return self._key_envelope() + self._encrypt_rsa(data)
             elif self.algorithm in ['AES-256', 'AES-192']:
-                return self._encrypt_aes(data)
+                return self._key_envelope() + self._encrypt_aes(data)
             elif self.algorithm == 'SHA':
                 return self._hash_sha256(data)
             else:
@@ -71,6 +187,10 @@ class EncryptionManager:
     def decrypt(self, encrypted_data):
         """Decrypt data using the selected algorithm"""
         try:
+            key_id, encrypted_data = self._split_key_envelope(encrypted_data)
+            if key_id and key_id != self.key_id:
+                return self._key_view(key_id).decrypt(encrypted_data)
+            
             if self.algorithm == 'RSA':
                 return self._decrypt_rsa(encrypted_data)
             elif self.algorithm in ['AES-256', 'AES-192']:
@@ -95,21 +215,15 @@ class EncryptionManager:
             # Generate temporary AES key
             temp_aes_key = os.urandom(32)
             
-            # Encrypt data with AES
-            encrypted_data = self._encrypt_aes_with_key(data, temp_aes_key)
+            # Encrypt data with AES-GCM
+            nonce = os.urandom(12)
+            encrypted_data = nonce + AESGCM(temp_aes_key).encrypt(nonce, data, None)
             
             # Encrypt AES key with RSA
-            encrypted_key = self.public_key.encrypt(
-                temp_aes_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            encrypted_key = self._rsa_wrap_key(temp_aes_key)
             
-            # Combine encrypted key and data
-            return encrypted_key + b'|SEPARATOR|' + encrypted_data
+            # Length-prefix the wrapped key so no delimiter scan is needed
+            return HYBRID_MAGIC + struct.pack('>H', len(encrypted_key)) + encrypted_key + encrypted_data
         else:
             # Direct RSA encryption for small data
             return self.public_key.encrypt(
@@ -126,21 +240,22 @@ class EncryptionManager:
         if not self.private_key:
             raise ValueError("RSA private key not available")
         
-        if b'|SEPARATOR|' in encrypted_data:
+        if (encrypted_data[:4] == HYBRID_MAGIC
+                and len(encrypted_data) != self.private_key.key_size // 8):
             # Hybrid decryption
-            parts = encrypted_data.split(b'|SEPARATOR|', 1)
+            key_length = struct.unpack('>H', encrypted_data[4:6])[0]
+            encrypted_key = encrypted_data[6:6 + key_length]
+            payload = encrypted_data[6 + key_length:]
+            aes_key = self._rsa_unwrap_key(encrypted_key)
+            return AESGCM(aes_key).decrypt(payload[:12], payload[12:], None)
+        elif LEGACY_SEPARATOR in encrypted_data:
+            # Legacy hybrid format from earlier exports (AES-CBC payload)
+            parts = encrypted_data.split(LEGACY_SEPARATOR, 1)
             encrypted_key = parts[0]
             encrypted_data = parts[1]
             
             # Decrypt AES key
-            aes_key = self.private_key.decrypt(
-                encrypted_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            aes_key = self._rsa_unwrap_key(encrypted_key)
             
             # Decrypt data with AES
             return self._decrypt_aes_with_key(encrypted_data, aes_key)
@@ -155,6 +270,28 @@ class EncryptionManager:
                 )
             )
     
+    def _rsa_wrap_key(self, key):
+        """Wrap a symmetric key with the RSA public key"""
+        return self.public_key.encrypt(
+            key,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
+
+    def _rsa_unwrap_key(self, wrapped_key):
+        """Unwrap a symmetric key with the RSA private key"""
+        return self.private_key.decrypt(
+            wrapped_key,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
+
     def _encrypt_aes(self, data):
         """Encrypt data using AES"""
         return self._encrypt_aes_with_key(data, self.aes_key)
@@ -226,4 +363,141 @@ class EncryptionManager:
             data = data.encode('utf-8')
         
         calculated_hash = self._hash_sha256(data)
-        return calculated_hash == hash_value
\ No newline at end of file
+        return calculated_hash == hash_value
+
+    def encrypt_stream(self, source, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+        """Encrypt a file object or iterable of bytes into AES-GCM framed chunks
+
+        Yields the container header followed by one frame per chunk. Memory use
+        is bounded by chunk_size times the number of chunks in flight; with
+        workers > 1 chunks are sealed in parallel and emitted in order.
+        Unlike encrypt(), errors are raised rather than returning plaintext.
+        """
+        if self.algorithm == 'SHA':
+            raise ValueError("SHA is a one-way hash function, cannot encrypt streams")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+
+        header, data_key, nonce_prefix = self._new_stream_header(chunk_size)
+        aead = AESGCM(data_key)
+
+        def seal(index, chunk, final):
+            flag = 1 if final else 0
+            nonce = nonce_prefix + struct.pack('>Q', index)
+            aad = header + struct.pack('>QB', index, flag)
+            ciphertext = aead.encrypt(nonce, chunk, aad)
+            return STREAM_FRAME.pack(flag, len(ciphertext)) + ciphertext
+
+        yield self._key_envelope() + header
+
+        chunks = self._iter_stream_chunks(source, chunk_size)
+        if workers <= 1:
+            for index, chunk, final in chunks:
+                yield seal(index, chunk, final)
+            return
+
+        # Keep a bounded window of in-flight chunks so memory stays constant
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for index, chunk, final in chunks:
+                pending.append(executor.submit(seal, index, chunk, final))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def decrypt_stream(self, source):
+        """Decrypt a stream produced by encrypt_stream into an iterator of plaintext chunks"""
+        reader = _StreamReader(source)
+
+        magic = reader.read_exact(4)
+        if magic == KEY_MAGIC:
+            key_id = reader.read_exact(reader.read_exact(1)[0]).decode('ascii')
+            magic = reader.read_exact(4)
+            if key_id != self.key_id:
+                return self._key_view(key_id)._decrypt_stream_body(reader, magic)
+        return self._decrypt_stream_body(reader, magic)
+
+    def _decrypt_stream_body(self, reader, magic):
+        """Decrypt the container that follows the optional key envelope"""
+        fixed = magic + reader.read_exact(STREAM_HEADER.size - len(magic))
+        magic, version, key_mode, chunk_size, nonce_prefix, wrapped_length = STREAM_HEADER.unpack(fixed)
+        if magic != STREAM_MAGIC:
+            raise ValueError("Not an encrypted stream")
+        if version != STREAM_VERSION:
+            raise ValueError(f"Unsupported stream version: {version}")
+
+        wrapped_key = reader.read_exact(wrapped_length)
+        header = fixed + wrapped_key
+        aead = AESGCM(self._unwrap_stream_key(key_mode, wrapped_key))
+        nonce_prefix = struct.pack('>I', nonce_prefix)
+        max_frame = chunk_size + GCM_TAG_SIZE
+
+        index = 0
+        while True:
+            flag, length = STREAM_FRAME.unpack(reader.read_exact(STREAM_FRAME.size))
+            if length > max_frame:
+                raise ValueError("Encrypted stream frame exceeds chunk size")
+            ciphertext = reader.read_exact(length)
+            nonce = nonce_prefix + struct.pack('>Q', index)
+            aad = header + struct.pack('>QB', index, flag)
+            yield aead.decrypt(nonce, ciphertext, aad)
+            if flag:
+                break
+            index += 1
+
+        if reader.read(1):
+            raise ValueError("Trailing data after final stream frame")
+
+    def _new_stream_header(self, chunk_size):
+        """Create a per-stream data key and the header that carries it"""
+        nonce_prefix = os.urandom(4)
+
+        if self.algorithm == 'RSA':
+            if not self.public_key:
+                raise ValueError("RSA public key not available")
+            data_key = AESGCM.generate_key(bit_length=256)
+            key_mode = STREAM_KEY_RSA
+            wrapped_key = self._rsa_wrap_key(data_key)
+        elif self.algorithm in ['AES-256', 'AES-192']:
+            if not self.aes_key:
+                raise ValueError("AES key not available")
+            data_key = os.urandom(len(self.aes_key))
+            key_mode = STREAM_KEY_AES
+            key_nonce = os.urandom(12)
+            wrapped_key = key_nonce + AESGCM(self.aes_key).encrypt(key_nonce, data_key, STREAM_MAGIC)
+        else:
+            raise ValueError(f"Unsupported algorithm: {self.algorithm}")
+
+        header = STREAM_HEADER.pack(
+            STREAM_MAGIC, STREAM_VERSION, key_mode, chunk_size,
+            struct.unpack('>I', nonce_prefix)[0], len(wrapped_key)
+        ) + wrapped_key
+        return header, data_key, nonce_prefix
+
+    def _unwrap_stream_key(self, key_mode, wrapped_key):
+        """Recover the per-stream data key from its wrapped form"""
+        if key_mode == STREAM_KEY_RSA:
+            if not self.private_key:
+                raise ValueError("RSA private key not available")
+            return self._rsa_unwrap_key(wrapped_key)
+        if key_mode == STREAM_KEY_AES:
+            if not self.aes_key:
+                raise ValueError("AES key not available")
+            return AESGCM(self.aes_key).decrypt(wrapped_key[:12], wrapped_key[12:], STREAM_MAGIC)
+        raise ValueError(f"Unsupported stream key mode: {key_mode}")
+
+    @staticmethod
+    def _iter_stream_chunks(source, chunk_size):
+        """Re-chunk the source into (index, chunk, is_final) with one chunk of lookahead"""
+        reader = _StreamReader(source)
+        index = 0
+        current = reader.read(chunk_size)
+        while True:
+            following = reader.read(chunk_size) if len(current) == chunk_size else b''
+            final = not following
+            yield index, current, final
+            if final:
+                return
+            current = following
+            index += 1
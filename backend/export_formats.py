@@ -0,0 +1,215 @@
+import io
+import json
+import gzip
+import logging
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd compression
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional: Arrow IPC / Parquet export
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ['json', 'csv', 'ndjson', 'columnar', 'arrow', 'parquet', 'npz']
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+
+FORMAT_EXTENSIONS = {
+    'json': 'json',
+    'csv': 'csv',
+    'ndjson': 'ndjson',
+    'arrow': 'arrow',
+    'parquet': 'parquet',
+    'npz': 'npz',
+}
+
+COMPRESSION_EXTENSIONS = {
+    'gzip': 'gz',
+    'zstd': 'zst',
+}
+
+# Codecs formats with built-in compression can apply; others accept all COMPRESSIONS
+FORMAT_COMPRESSIONS = {
+    'arrow': ['none', 'zstd'],
+    'npz': ['none'],
+}
+
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'zstd': 3,
+}
+
+
+def available_formats():
+    """Return export formats usable with the installed optional packages"""
+    formats = ['json', 'csv', 'ndjson', 'columnar', 'npz']
+    if pa is not None:
+        formats.extend(['arrow', 'parquet'])
+    return formats
+
+
+def supported_compressions(format_type):
+    """Compressions encode_logs accepts for a format"""
+    return FORMAT_COMPRESSIONS.get(resolve_format(format_type), COMPRESSIONS)
+
+
+def resolve_format(format_type):
+    """Map the generic 'columnar' format onto the best available encoder"""
+    if format_type == 'columnar':
+        return 'parquet' if pa is not None else 'npz'
+    if format_type in ('arrow', 'parquet') and pa is None:
+        raise ValueError(f"{format_type} export requires pyarrow")
+    if format_type not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported export format: {format_type}")
+    return format_type
+
+
+def encode_logs(logs, format_type='json', compression='none', level=None):
+    """Serialize and optionally compress logs
+
+    Returns (data, format, compression, extension). Parquet and Arrow carry
+    their own column compression and npz is a deflated zip, so the outer
+    compression step is skipped for them; combinations they can't honour
+    (gzip for Arrow, any codec for npz) raise ValueError.
+    """
+    format_type = resolve_format(format_type)
+    compression = compression or 'none'
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    if compression not in supported_compressions(format_type):
+        raise ValueError(f"Compression {compression} is not supported for {format_type} exports")
+
+    outer = compression
+    if format_type == 'json':
+        data = json.dumps(logs, indent=2).encode('utf-8')
+    elif format_type == 'csv':
+        import pandas as pd
+        data = pd.DataFrame(logs).to_csv(index=False).encode('utf-8')
+    elif format_type == 'ndjson':
+        data = ''.join(json.dumps(log, separators=(',', ':')) + '\n' for log in logs).encode('utf-8')
+    elif format_type == 'arrow':
+        data = _encode_arrow(logs, compression, level)
+        outer = 'none'
+    elif format_type == 'parquet':
+        data = _encode_parquet(logs, compression, level)
+        outer = 'none'
+    else:
+        data = _encode_npz(logs)
+        outer = 'none'
+
+    data = compress(data, outer, level)
+
+    extension = FORMAT_EXTENSIONS[format_type]
+    if outer != 'none':
+        extension += '.' + COMPRESSION_EXTENSIONS[outer]
+    return data, format_type, compression, extension
+
+
+def compress(data, compression='none', level=None):
+    """Compress bytes with gzip or zstd at the given level"""
+    if compression == 'none':
+        return data
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=level)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def decompress(data, compression='none'):
+    """Inverse of compress()"""
+    if compression == 'none':
+        return data
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def _encode_arrow(logs, compression, level):
+    """Encode logs as an Arrow IPC file"""
+    table = pa.Table.from_pylist(logs)
+    options = None
+    if compression == 'zstd':
+        options = pa.ipc.IpcWriteOptions(compression=pa.Codec('zstd', compression_level=level))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _encode_parquet(logs, compression, level):
+    """Encode logs as a Parquet file"""
+    table = pa.Table.from_pylist(logs)
+    codec = {'none': 'snappy', 'gzip': 'gzip', 'zstd': 'zstd'}[compression]
+    sink = io.BytesIO()
+    pq.write_table(table, sink, compression=codec,
+                   compression_level=level if compression != 'none' else None)
+    return sink.getvalue()
+
+
+def _encode_npz(logs):
+    """Encode logs as a NumPy columnar container
+
+    The container is a compressed .npz archive readable with numpy.load:
+      __columns__          column names in original order
+      <name>               bool/int64/float64 array for numeric columns
+      <name>.categories    unique string values for text columns
+      <name>.codes         int32 index into <name>.categories per row
+    Missing values in text columns are stored as the empty string.
+    """
+    columns = []
+    for log in logs:
+        for key in log:
+            if key not in columns:
+                columns.append(key)
+
+    arrays = {'__columns__': np.array(columns, dtype=str)}
+    for column in columns:
+        values = [log.get(column) for log in logs]
+        if all(isinstance(v, bool) for v in values):
+            arrays[column] = np.array(values, dtype=bool)
+        elif all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+            arrays[column] = np.array(values, dtype=np.int64)
+        elif all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            arrays[column] = np.array(values, dtype=np.float64)
+        else:
+            text = ['' if v is None else str(v) for v in values]
+            categories, codes = np.unique(np.array(text, dtype=str), return_inverse=True)
+            arrays[f'{column}.categories'] = categories
+            arrays[f'{column}.codes'] = codes.astype(np.int32)
+
+    sink = io.BytesIO()
+    np.savez_compressed(sink, **arrays)
+    return sink.getvalue()
+
+
+def decode_npz(data):
+    """Decode an npz export back into a list of dicts"""
+    archive = np.load(io.BytesIO(data), allow_pickle=False)
+    columns = [str(c) for c in archive['__columns__']]
+    decoded = {}
+    for column in columns:
+        if column in archive.files:
+            decoded[column] = archive[column].tolist()
+        else:
+            categories = archive[f'{column}.categories']
+            decoded[column] = categories[archive[f'{column}.codes']].tolist()
+
+    rows = len(decoded[columns[0]]) if columns else 0
+    return [{column: decoded[column][i] for column in columns} for i in range(rows)]
@@ -0,0 +1,147 @@
+import os
+import time
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-process key: without it, a sender could pick ports whose flows always
+# hash above the keep ratio and be dropped first under load
+FLOW_HASH_KEY = os.urandom(16)
+
+
+def flow_hash(packet_data):
+    """Keyed hash of a packet's flow in [0, 1), equal for both directions
+
+    The flow is the (address, port) pair of each endpoint. Packets without
+    ports (ICMP, ARP, ...) fall back to the address pair plus protocol,
+    since their highest-layer protocol is stable within a flow.
+    """
+    src = (packet_data.get('source_ip', ''), packet_data.get('source_port'))
+    dst = (packet_data.get('destination_ip', ''), packet_data.get('destination_port'))
+    low, high = sorted([src, dst], key=str)
+    key = f"{low[0]}|{low[1]}|{high[0]}|{high[1]}"
+    if src[1] is None and dst[1] is None:
+        key += f"|{packet_data.get('protocol', '')}"
+    digest = hashlib.blake2b(key.encode('utf-8'), key=FLOW_HASH_KEY, digest_size=4).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 32
+
+
+class FlowSampler:
+    """Keep or drop whole flows when scoring can't keep up
+
+    While the keep ratio is below 1, every packet first goes through the
+    precheck, which returns (flagged, detail): flagged packets are always
+    kept with sample_weight 1, and detail is handed to the callback as its
+    second argument (None when the precheck didn't run) so the callback
+    doesn't repeat the work. Other
+    packets are kept when their flow hash is below keep_ratio, so every
+    unflagged packet of a kept flow is scored and flows drop out in a fixed
+    order as the ratio shrinks; they carry sample_weight 1 / keep_ratio.
+    Summed weights are therefore unbiased traffic estimates. Every
+    adjust_interval seconds the ratio is steered so that the time spent in
+    the precheck (paid for every packet) plus the time spent downstream
+    (which scales with the ratio) stays near target_utilization of wall time.
+    """
+
+    def __init__(self, callback, precheck=None, target_utilization=0.8, min_ratio=0.01, adjust_interval=1.0):
+        self.callback = callback
+        self.precheck = precheck
+        self.target_utilization = target_utilization
+        self.min_ratio = min_ratio
+        self.adjust_interval = adjust_interval
+        self.keep_ratio = 1.0
+        self.lock = threading.Lock()
+
+        self.window_start = time.monotonic()
+        self.window_busy = 0.0
+        self.window_precheck = 0.0
+
+        self.offered = 0
+        self.kept = 0
+        self.forced = 0
+        self.estimated_total = 0.0
+
+    def process(self, packet_data):
+        """Sampling stage between capture and the packet callback"""
+        with self.lock:
+            self.offered += 1
+            keep_ratio = self.keep_ratio
+
+        weight = None
+        forced = False
+        detail = None
+        precheck_time = 0.0
+        if keep_ratio >= 1.0:
+            weight = 1.0
+        else:
+            if self.precheck:
+                started = time.perf_counter()
+                forced, detail = self._flagged(packet_data)
+                precheck_time = time.perf_counter() - started
+            if forced:
+                weight = 1.0
+            elif flow_hash(packet_data) < keep_ratio:
+                weight = 1.0 / keep_ratio
+
+        busy = 0.0
+        if weight is not None:
+            packet_data['sample_weight'] = weight
+            started = time.perf_counter()
+            self.callback(packet_data, detail)
+            busy = time.perf_counter() - started
+
+        with self.lock:
+            self.window_precheck += precheck_time
+            if weight is not None:
+                self.kept += 1
+                self.window_busy += busy
+                self.estimated_total += weight
+                if forced:
+                    self.forced += 1
+
+        self._maybe_adjust()
+
+    def _flagged(self, packet_data):
+        try:
+            flagged, detail = self.precheck(packet_data)
+            return bool(flagged), detail
+        except Exception as e:
+            logger.debug(f"Sampling precheck error: {e}")
+            return True, None  # keep packets we couldn't check
+
+    def _maybe_adjust(self):
+        """Steer keep_ratio towards the target utilization"""
+        now = time.monotonic()
+        with self.lock:
+            elapsed = now - self.window_start
+            if elapsed < self.adjust_interval:
+                return
+
+            # The precheck cost is fixed per offered packet; only the
+            # downstream share scales with the keep ratio
+            fixed = self.window_precheck / elapsed
+            scalable = self.window_busy / elapsed
+            if scalable > 0:
+                available = self.target_utilization - fixed
+                if available <= 0:
+                    ratio = self.min_ratio
+                else:
+                    # Damped multiplicative step so the ratio doesn't oscillate
+                    ratio = self.keep_ratio * (available / scalable) ** 0.5
+                self.keep_ratio = min(1.0, max(self.min_ratio, ratio))
+
+            self.window_start = now
+            self.window_busy = 0.0
+            self.window_precheck = 0.0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'keep_ratio': self.keep_ratio,
+                'offered': self.offered,
+                'kept': self.kept,
+                'forced': self.forced,
+                'estimated_total': self.estimated_total
+            }
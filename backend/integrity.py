@@ -0,0 +1,459 @@
+import os
+import json
+import time
+import struct
+import hashlib
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Index record per chunk: start_ts, end_ts, data offset, data length, leaf hash
+INDEX_RECORD = struct.Struct('>ddQI32s')
+CHAIN_META = struct.Struct('>QQdd')
+GENESIS = b'\x00' * 32
+
+
+def _leaf_hash(data):
+    """Hash a chunk as a Merkle leaf (domain-separated from inner nodes)"""
+    return hashlib.sha256(b'\x00' + data).digest()
+
+
+def _node_hash(left, right):
+    """Hash two child nodes into their parent"""
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _split(size):
+    """Largest power of two strictly smaller than size (RFC 6962 tree shape)"""
+    k = 1
+    while k * 2 < size:
+        k *= 2
+    return k
+
+
+def _subtree_root(leaves, lo, hi):
+    if hi - lo == 1:
+        return leaves[lo]
+    mid = lo + _split(hi - lo)
+    return _node_hash(_subtree_root(leaves, lo, mid), _subtree_root(leaves, mid, hi))
+
+
+def inner_nodes(leaves):
+    """Every inner node of the tree over leaves, in pre-order
+
+    A subtree of size s has s - 1 inner nodes, so a node's right child sits
+    (mid - lo) positions after it; range_proof uses this to find stored nodes.
+    """
+    nodes = []
+
+    def build(lo, hi):
+        if hi - lo == 1:
+            return leaves[lo]
+        position = len(nodes)
+        nodes.append(None)
+        mid = lo + _split(hi - lo)
+        nodes[position] = _node_hash(build(lo, mid), build(mid, hi))
+        return nodes[position]
+
+    if leaves:
+        build(0, len(leaves))
+    return nodes
+
+
+def merkle_root(leaves):
+    """Merkle root over a list of leaf hashes"""
+    if not leaves:
+        return hashlib.sha256(b'').digest()
+    return _subtree_root(leaves, 0, len(leaves))
+
+
+def range_proof(leaves, start, end, inner=None):
+    """Sibling hashes needed to rebuild the root from leaves[start:end]
+
+    For a contiguous range the proof holds O(log n) hashes: one for every
+    maximal subtree lying entirely outside the range. inner maps a pre-order
+    inner-node position (see inner_nodes) to its stored hash, so building
+    the proof touches O(log n) nodes; without it each subtree is rehashed
+    from its leaves, which is O(n).
+    """
+    def walk(lo, hi, position):
+        if end <= lo or start >= hi:
+            if hi - lo == 1:
+                return [leaves[lo]]
+            return [inner(position) if inner else _subtree_root(leaves, lo, hi)]
+        if hi - lo == 1:
+            return []
+        mid = lo + _split(hi - lo)
+        return walk(lo, mid, position + 1) + walk(mid, hi, position + mid - lo)
+
+    return walk(0, len(leaves), 0)
+
+
+def root_from_range(size, start, range_leaves, proof):
+    """Recompute a Merkle root from the leaves of a range plus its proof"""
+    end = start + len(range_leaves)
+    proof = iter(proof)
+
+    def walk(lo, hi):
+        if end <= lo or start >= hi:
+            return next(proof)
+        if hi - lo == 1:
+            return range_leaves[lo - start]
+        mid = lo + _split(hi - lo)
+        return _node_hash(walk(lo, mid), walk(mid, hi))
+
+    root = walk(0, size)
+    if next(proof, None) is not None:
+        raise ValueError("Unused hashes in range proof")
+    return root
+
+
+def chain_hash(prev_hash, root, index, count, start_ts, end_ts):
+    """Link a segment root to the previous segment's chain hash"""
+    return hashlib.sha256(prev_hash + root + CHAIN_META.pack(index, count, start_ts, end_ts)).digest()
+
+
+def parse_timestamp(value):
+    """Parse an epoch number or ISO-8601 string into epoch seconds"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class IntegrityLog:
+    """Append-only, tamper-evident store of captured packets
+
+    Packets are buffered into chunks; each chunk becomes a SHA-256 leaf in
+    its segment's Merkle tree. When a segment fills up it is sealed and its
+    root is chained to the previous segment's chain hash in chain.jsonl.
+    Appends cost O(chunk); verifying a time range reads only the chunks in
+    that range plus O(log n) hashes per segment and the chain of roots.
+    With retention_segments set, only that many sealed segments keep their
+    data; older ones are deleted but stay in the chain, so the hash chain
+    from the oldest retained segment to the head still verifies.
+    """
+
+    def __init__(self, directory='integrity', chunk_packets=500, segment_chunks=1024, retention_segments=0):
+        self.directory = directory
+        self.chunk_packets = chunk_packets
+        self.segment_chunks = segment_chunks
+        self.retention_segments = retention_segments
+        self.lock = threading.Lock()
+
+        self.chain = []          # sealed segment entries, oldest first
+        self.open_index = []     # (start, end, offset, length, leaf) of the open segment
+        self.pending = []        # packets not yet written as a chunk
+        self.pending_start = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _segment_path(self, index, suffix):
+        return os.path.join(self.directory, f"segment_{index:06d}.{suffix}")
+
+    def _load(self):
+        """Load the chain and the open segment's index from disk
+
+        Raises instead of starting over on an unreadable log, since
+        appending to a half-loaded state would corrupt sealed segments.
+        """
+        try:
+            self.chain = self._read_chain()
+            self.open_index = self._read_index(len(self.chain))
+
+            # Drop data written after the last complete index record
+            data_path = self._segment_path(len(self.chain), 'dat')
+            if os.path.exists(data_path):
+                size = 0
+                if self.open_index:
+                    _, _, offset, length, _ = self.open_index[-1]
+                    size = offset + length
+                with open(data_path, 'r+b') as f:
+                    f.truncate(size)
+
+            # A crash between filling a segment and chaining it leaves it full but unsealed
+            if len(self.open_index) >= self.segment_chunks:
+                self._seal_locked()
+
+            logger.info(f"Integrity log loaded: {len(self.chain)} sealed segments, "
+                        f"{len(self.open_index)} open chunks")
+        except Exception as e:
+            logger.error(f"Error loading integrity log: {e}")
+            raise
+
+    def _read_chain(self):
+        """Read chain.jsonl, dropping a torn trailing record"""
+        chain_path = os.path.join(self.directory, 'chain.jsonl')
+        if not os.path.exists(chain_path):
+            return []
+        with open(chain_path, 'rb') as f:
+            raw = f.read()
+
+        chain = []
+        good = 0
+        lines = raw.split(b'\n')
+        for number, line in enumerate(lines):
+            last = number == len(lines) - 1
+            if line.strip():
+                try:
+                    entry = json.loads(line)
+                    if not isinstance(entry, dict):
+                        raise ValueError("Chain record is not an object")
+                except ValueError:
+                    if not last:
+                        raise ValueError(f"Corrupt chain record on line {number + 1}")
+                    logger.warning("Dropping torn trailing chain record")
+                    break
+                if entry.get('index') != len(chain):
+                    raise ValueError(f"Chain record {number + 1} is out of sequence")
+                chain.append(entry)
+            good += len(line) + (0 if last else 1)
+
+        if good != len(raw):
+            with open(chain_path, 'r+b') as f:
+                f.truncate(good)
+        elif raw and not raw.endswith(b'\n'):
+            # Complete final record whose newline never made it to disk
+            with open(chain_path, 'ab') as f:
+                f.write(b'\n')
+        return chain
+
+    def _read_index(self, segment):
+        """Read a segment's chunk index, ignoring a torn trailing record"""
+        path = self._segment_path(segment, 'idx')
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb') as f:
+            raw = f.read()
+        usable = len(raw) - len(raw) % INDEX_RECORD.size
+        return [INDEX_RECORD.unpack_from(raw, pos) for pos in range(0, usable, INDEX_RECORD.size)]
+
+    def record(self, packet_data):
+        """Buffer a packet, writing a chunk once chunk_packets have accumulated"""
+        with self.lock:
+            if not self.pending:
+                self.pending_start = self._packet_time(packet_data)
+            self.pending.append(packet_data)
+            if len(self.pending) >= self.chunk_packets:
+                self._flush_locked()
+
+    def flush(self):
+        """Write any buffered packets as a (possibly short) chunk"""
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        end = self._packet_time(self.pending[-1])
+        data = ''.join(json.dumps(p, separators=(',', ':')) + '\n' for p in self.pending).encode('utf-8')
+        self.pending = []
+        self._append_chunk_locked(data, self.pending_start, end)
+
+    def append_chunk(self, data, start_ts, end_ts):
+        """Append an opaque chunk covering [start_ts, end_ts]"""
+        with self.lock:
+            self._append_chunk_locked(data, start_ts, end_ts)
+
+    def _append_chunk_locked(self, data, start_ts, end_ts):
+        segment = len(self.chain)
+        data_path = self._segment_path(segment, 'dat')
+        offset = 0
+        if self.open_index:
+            _, _, last_offset, last_length, _ = self.open_index[-1]
+            offset = last_offset + last_length
+
+        with open(data_path, 'ab') as f:
+            f.write(data)
+        record = (start_ts, end_ts, offset, len(data), _leaf_hash(data))
+        with open(self._segment_path(segment, 'idx'), 'ab') as f:
+            f.write(INDEX_RECORD.pack(*record))
+        self.open_index.append(record)
+
+        if len(self.open_index) >= self.segment_chunks:
+            self._seal_locked()
+
+    def _seal_locked(self):
+        """Seal the open segment and chain its Merkle root"""
+        if not self.open_index:
+            return
+        index = len(self.chain)
+        leaves = [r[4] for r in self.open_index]
+        nodes = inner_nodes(leaves)
+        root = nodes[0] if nodes else merkle_root(leaves)
+        # Inner nodes let range proofs read O(log n) hashes instead of rehashing
+        with open(self._segment_path(index, 'tree'), 'wb') as f:
+            f.write(b''.join(nodes))
+        start_ts = self.open_index[0][0]
+        end_ts = self.open_index[-1][1]
+        prev = bytes.fromhex(self.chain[-1]['chain']) if self.chain else GENESIS
+        entry = {
+            'index': index,
+            'count': len(self.open_index),
+            'start': start_ts,
+            'end': end_ts,
+            'root': root.hex(),
+            'prev': prev.hex(),
+            'chain': chain_hash(prev, root, index, len(self.open_index), start_ts, end_ts).hex()
+        }
+        with open(os.path.join(self.directory, 'chain.jsonl'), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.chain.append(entry)
+        self.open_index = []
+        logger.info(f"Integrity segment {index} sealed with {entry['count']} chunks")
+        self._prune_locked()
+
+    def _prune_locked(self):
+        """Delete data of sealed segments beyond retention_segments"""
+        if not self.retention_segments:
+            return
+        for entry in self.chain[:-self.retention_segments]:
+            for suffix in ('dat', 'idx', 'tree'):
+                path = self._segment_path(entry['index'], suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+                    if suffix == 'dat':
+                        logger.info(f"Integrity segment {entry['index']} pruned")
+
+    def head(self):
+        """Latest chain hash; publish it externally to anchor the log"""
+        with self.lock:
+            return self.chain[-1]['chain'] if self.chain else GENESIS.hex()
+
+    def verify_range(self, from_ts=None, to_ts=None):
+        """Verify every stored chunk overlapping [from_ts, to_ts]
+
+        'status' is 'verified', 'failed', or 'unverifiable' when no chunk
+        in the range could be checked (all of it pruned, or nothing stored).
+        Only segments retention would have removed count as pruned; a
+        retained segment whose files are missing is an error.
+        """
+        from_ts = float('-inf') if from_ts is None else from_ts
+        to_ts = float('inf') if to_ts is None else to_ts
+
+        with self.lock:
+            chain = list(self.chain)
+            open_index = list(self.open_index)
+
+        result = {
+            'verified': True,
+            'status': 'verified',
+            'from': from_ts if from_ts != float('-inf') else None,
+            'to': to_ts if to_ts != float('inf') else None,
+            'segments': [],
+            'chunks': 0,
+            'hashes': 0,
+            'head': chain[-1]['chain'] if chain else GENESIS.hex(),
+            'pruned': [],
+            'errors': []
+        }
+
+        retained_from = len(chain) - self.retention_segments if self.retention_segments else 0
+        first_checked = None
+        for entry in chain:
+            if entry['end'] < from_ts or entry['start'] > to_ts:
+                continue
+            if entry['index'] < retained_from:
+                result['pruned'].append(entry['index'])  # removed by retention
+                continue
+            if first_checked is None:
+                first_checked = entry['index']
+            if not all(os.path.exists(self._segment_path(entry['index'], suffix)) for suffix in ('idx', 'dat')):
+                result['errors'].append(f"Segment {entry['index']} is retained but its files are missing")
+                continue
+            self._verify_segment(entry['index'], self._read_index(entry['index']),
+                                 from_ts, to_ts, bytes.fromhex(entry['root']), result)
+
+        # Every link from the first checked segment to the head must hold
+        if first_checked is not None:
+            prev = bytes.fromhex(chain[first_checked]['prev'])
+            if first_checked == 0 and prev != GENESIS:
+                result['errors'].append("Chain does not start at genesis")
+            for entry in chain[first_checked:]:
+                expected = chain_hash(prev, bytes.fromhex(entry['root']), entry['index'],
+                                      entry['count'], entry['start'], entry['end'])
+                if entry['prev'] != prev.hex() or entry['chain'] != expected.hex():
+                    result['errors'].append(f"Chain link broken at segment {entry['index']}")
+                prev = expected
+                result['hashes'] += 1
+
+        # The open segment has no sealed root yet; check chunks against its index
+        if open_index:
+            self._verify_segment(len(chain), open_index, from_ts, to_ts, None, result)
+
+        if result['errors']:
+            result['status'] = 'failed'
+        elif not result['chunks']:
+            result['status'] = 'unverifiable'
+        result['verified'] = result['status'] == 'verified'
+        return result
+
+    def _verify_segment(self, segment, index, from_ts, to_ts, expected_root, result):
+        """Check the chunks of one segment that overlap the range"""
+        positions = [i for i, r in enumerate(index) if r[1] >= from_ts and r[0] <= to_ts]
+        if not positions:
+            return
+        start, end = positions[0], positions[-1] + 1
+
+        range_leaves = []
+        with open(self._segment_path(segment, 'dat'), 'rb') as f:
+            for _, _, offset, length, _ in index[start:end]:
+                f.seek(offset)
+                range_leaves.append(_leaf_hash(f.read(length)))
+
+        if expected_root is None:
+            ok = range_leaves == [r[4] for r in index[start:end]]
+            proof_size = 0
+        else:
+            leaves = [r[4] for r in index]
+            proof = self._segment_proof(segment, leaves, start, end)
+            ok = root_from_range(len(index), start, range_leaves, proof) == expected_root
+            if not ok and os.path.exists(self._segment_path(segment, 'tree')):
+                # The tree file only speeds proofs up; rule it out before failing the data
+                logger.warning(f"Integrity segment {segment} tree doesn't match its index, rehashing")
+                proof = range_proof(leaves, start, end)
+                ok = root_from_range(len(index), start, range_leaves, proof) == expected_root
+            proof_size = len(proof)
+
+        result['segments'].append({
+            'index': segment,
+            'sealed': expected_root is not None,
+            'chunks': [start, end],
+            'proof_hashes': proof_size,
+            'verified': ok
+        })
+        result['chunks'] += end - start
+        result['hashes'] += proof_size
+        if not ok:
+            result['errors'].append(f"Segment {segment} chunks {start}-{end - 1} failed verification")
+
+    def _segment_proof(self, segment, leaves, start, end):
+        """Range proof from the segment's stored inner nodes, if it has them"""
+        tree_path = self._segment_path(segment, 'tree')
+        if not os.path.exists(tree_path):
+            return range_proof(leaves, start, end)  # sealed before trees were stored
+        with open(tree_path, 'rb') as f:
+            def inner(position):
+                f.seek(position * 32)
+                node = f.read(32)
+                if len(node) != 32:
+                    raise ValueError(f"Segment {segment} tree is truncated")
+                return node
+            try:
+                return range_proof(leaves, start, end, inner)
+            except ValueError:
+                return range_proof(leaves, start, end)
+
+    @staticmethod
+    def _packet_time(packet_data):
+        try:
+            return parse_timestamp(packet_data.get('timestamp')) or time.time()
+        except (TypeError, ValueError):
+            return time.time()
@@ -0,0 +1,308 @@
+import os
+import json
+import queue
+import base64
+import threading
+import logging
+from datetime import datetime
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidTag
+
+logger = logging.getLogger(__name__)
+
+AES_KEY_SIZES = {
+    'AES-256': 32,
+    'AES-192': 24,
+}
+
+PASSPHRASE_ENV = 'SNM_KEYSTORE_PASSPHRASE'
+
+# Passphrase-wrapped AES key file: magic, then base64(salt | nonce | AES-GCM(key))
+WRAP_MAGIC = b'SNMKEY1:'
+WRAP_SALT_SIZE = 16
+WRAP_NONCE_SIZE = 12
+WRAP_TAG_SIZE = 16
+
+
+def _wrapping_key(passphrase, salt):
+    return Scrypt(salt=salt, length=32, n=2 ** 14, r=8, p=1, backend=default_backend()).derive(passphrase)
+
+
+def wrap_key(passphrase, key, key_id):
+    """Seal AES key material under a passphrase-derived key, bound to its key id"""
+    salt = os.urandom(WRAP_SALT_SIZE)
+    nonce = os.urandom(WRAP_NONCE_SIZE)
+    sealed = AESGCM(_wrapping_key(passphrase, salt)).encrypt(nonce, key, key_id.encode('utf-8'))
+    return WRAP_MAGIC + base64.b64encode(salt + nonce + sealed)
+
+
+def unwrap_key(passphrase, data, key_id):
+    raw = base64.b64decode(data[len(WRAP_MAGIC):])
+    salt = raw[:WRAP_SALT_SIZE]
+    nonce = raw[WRAP_SALT_SIZE:WRAP_SALT_SIZE + WRAP_NONCE_SIZE]
+    sealed = raw[WRAP_SALT_SIZE + WRAP_NONCE_SIZE:]
+    return AESGCM(_wrapping_key(passphrase, salt)).decrypt(nonce, sealed, key_id.encode('utf-8'))
+
+
+def _aes_key_size(data):
+    """Key length stored in a .key file, wrapped or plain base64"""
+    if data.startswith(WRAP_MAGIC):
+        raw = base64.b64decode(data[len(WRAP_MAGIC):], validate=True)
+        return len(raw) - WRAP_SALT_SIZE - WRAP_NONCE_SIZE - WRAP_TAG_SIZE
+    return len(base64.b64decode(data, validate=True))
+
+
+class KeyManager:
+    """Persistent keystore with background RSA key generation
+
+    Every key gets an id and is written to the keystore directory, so data
+    encrypted under a key stays decryptable after the active key for an
+    algorithm is rotated. Once start_rsa_pool() is called, RSA keys are
+    generated ahead of time by a worker thread into a small pool so RSA
+    rotations don't block a request. When SNM_KEYSTORE_PASSPHRASE is set,
+    RSA private keys are PEM-encrypted and AES keys are sealed with AES-GCM
+    under a scrypt-derived key; plain AES key files from before are
+    rewrapped the first time they are loaded.
+    """
+
+    def __init__(self, directory='keystore', rsa_pool_size=2, rsa_key_size=2048):
+        self.directory = directory
+        self.rsa_key_size = rsa_key_size
+        self.lock = threading.Lock()
+        self.index = {'active': {}, 'keys': {}}
+        self.keys = {}  # key_id -> loaded key material
+        self.rsa_pool_size = rsa_pool_size
+        self.rsa_pool = queue.Queue(maxsize=max(rsa_pool_size, 1))
+        self.running = True
+
+        passphrase = os.environ.get(PASSPHRASE_ENV)
+        self.passphrase = passphrase.encode('utf-8') if passphrase else None
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+        self.worker = None
+
+    def start_rsa_pool(self):
+        """Start pre-generating RSA keys; only worth it while RSA is in use"""
+        with self.lock:
+            if self.worker is not None or self.rsa_pool_size <= 0:
+                return
+            self.worker = threading.Thread(target=self._rsa_pool_worker, daemon=True)
+            self.worker.start()
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'keys.json')
+
+    def _load(self):
+        """Load the key index; key material is loaded lazily on first use
+
+        A keys.json that can't be parsed is set aside and the index rebuilt
+        from the key files, so existing key ids stay resolvable. I/O errors
+        are raised: starting an empty keystore over them would orphan every
+        earlier key.
+        """
+        path = self._index_path()
+        if not os.path.exists(path):
+            if any(name.endswith(('.key', '.pem')) for name in os.listdir(self.directory)):
+                logger.error("Keystore index missing, rebuilding from key files")
+                self._rebuild_index()
+            return
+
+        with open(path, 'r') as f:
+            raw = f.read()
+        try:
+            index = json.loads(raw)
+            if not isinstance(index.get('active'), dict) or not isinstance(index.get('keys'), dict):
+                raise ValueError("missing 'active' or 'keys'")
+        except (ValueError, AttributeError) as e:
+            backup = f"{path}.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            os.replace(path, backup)
+            logger.error(f"Keystore index is corrupt ({e}); moved to {backup}, rebuilding from key files")
+            self._rebuild_index()
+            return
+
+        self.index = index
+        logger.info(f"Keystore loaded: {len(self.index['keys'])} keys")
+
+    def _rebuild_index(self):
+        """Recreate keys.json from the *.key / *.pem files in the keystore
+
+        The newest key file per algorithm becomes active again.
+        """
+        sizes = {size: algorithm for algorithm, size in AES_KEY_SIZES.items()}
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            key_id, ext = os.path.splitext(name)
+            path = os.path.join(self.directory, name)
+            if ext == '.pem':
+                algorithm = 'RSA'
+            elif ext == '.key':
+                with open(path, 'rb') as f:
+                    try:
+                        algorithm = sizes.get(_aes_key_size(f.read()))
+                    except ValueError:
+                        algorithm = None
+                if algorithm is None:
+                    logger.error(f"Skipping unreadable key file {name}")
+                    continue
+            else:
+                continue
+            modified = os.path.getmtime(path)
+            entries.append((modified, key_id, algorithm, name))
+
+        index = {'active': {}, 'keys': {}}
+        for modified, key_id, algorithm, name in sorted(entries):
+            index['keys'][key_id] = {
+                'algorithm': algorithm,
+                'file': name,
+                'created': datetime.fromtimestamp(modified).isoformat(),
+                'recovered': True
+            }
+            index['active'][algorithm] = key_id  # newest wins
+
+        self.index = index
+        self._save_index()
+        logger.warning(f"Keystore index rebuilt with {len(index['keys'])} keys")
+
+    def _write_file(self, name, data):
+        """Atomically write a file readable only by the owner"""
+        path = os.path.join(self.directory, name)
+        tmp_path = path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _save_index(self):
+        self._write_file('keys.json', json.dumps(self.index, indent=2).encode('utf-8'))
+
+    def _rsa_pool_worker(self):
+        """Keep the pool of pre-generated RSA keys topped up"""
+        while self.running:
+            try:
+                key = self._generate_rsa_key()
+                # Blocks while the pool is full; wakes periodically to check running
+                while self.running:
+                    try:
+                        self.rsa_pool.put(key, timeout=1.0)
+                        break
+                    except queue.Full:
+                        continue
+            except Exception as e:
+                logger.error(f"RSA pool worker error: {e}")
+                break
+
+    def _generate_rsa_key(self):
+        return rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=self.rsa_key_size,
+            backend=default_backend()
+        )
+
+    def _new_key(self, algorithm):
+        """Produce fresh key material for an algorithm"""
+        if algorithm == 'RSA':
+            try:
+                return self.rsa_pool.get_nowait()
+            except queue.Empty:
+                logger.warning("RSA key pool empty, generating synchronously")
+                return self._generate_rsa_key()
+        if algorithm in AES_KEY_SIZES:
+            return os.urandom(AES_KEY_SIZES[algorithm])
+        raise ValueError(f"Unsupported algorithm: {algorithm}")
+
+    def _store_key(self, algorithm, key):
+        """Persist key material and register it in the index"""
+        key_id = os.urandom(8).hex()
+        if algorithm == 'RSA':
+            encryption = (serialization.BestAvailableEncryption(self.passphrase)
+                          if self.passphrase else serialization.NoEncryption())
+            filename = f"{key_id}.pem"
+            data = key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=encryption
+            )
+        else:
+            filename = f"{key_id}.key"
+            data = wrap_key(self.passphrase, key, key_id) if self.passphrase else base64.b64encode(key)
+
+        self._write_file(filename, data)
+        self.index['keys'][key_id] = {
+            'algorithm': algorithm,
+            'file': filename,
+            'created': datetime.now().isoformat()
+        }
+        self.keys[key_id] = key
+        return key_id
+
+    def _load_key(self, key_id):
+        """Load key material for a key id from disk"""
+        record = self.index['keys'][key_id]
+        with open(os.path.join(self.directory, record['file']), 'rb') as f:
+            data = f.read()
+        if record['algorithm'] == 'RSA':
+            key = serialization.load_pem_private_key(data, password=self.passphrase, backend=default_backend())
+        elif data.startswith(WRAP_MAGIC):
+            if not self.passphrase:
+                raise ValueError(f"Key {key_id} is passphrase-protected; set {PASSPHRASE_ENV}")
+            try:
+                key = unwrap_key(self.passphrase, data, key_id)
+            except InvalidTag:
+                raise ValueError(f"Key {key_id} can't be unwrapped; wrong {PASSPHRASE_ENV}?")
+        else:
+            key = base64.b64decode(data)
+            if self.passphrase:
+                self._write_file(record['file'], wrap_key(self.passphrase, key, key_id))
+                logger.info(f"Key {key_id} rewrapped under the keystore passphrase")
+        self.keys[key_id] = key
+        return key
+
+    def active_key(self, algorithm):
+        """Return (key_id, key) for the algorithm, creating one if needed"""
+        with self.lock:
+            key_id = self.index['active'].get(algorithm)
+            if key_id is None:
+                return self._rotate_locked(algorithm)
+            key = self.keys.get(key_id) or self._load_key(key_id)
+            return key_id, key
+
+    def get_key(self, key_id):
+        """Return (algorithm, key) for any key ever issued by this store"""
+        with self.lock:
+            if key_id not in self.index['keys']:
+                raise KeyError(f"Unknown key id: {key_id}")
+            key = self.keys.get(key_id) or self._load_key(key_id)
+            return self.index['keys'][key_id]['algorithm'], key
+
+    def rotate(self, algorithm):
+        """Make a new key active for the algorithm; old keys remain available"""
+        with self.lock:
+            return self._rotate_locked(algorithm)
+
+    def _rotate_locked(self, algorithm):
+        key = self._new_key(algorithm)
+        key_id = self._store_key(algorithm, key)
+        self.index['active'][algorithm] = key_id
+        self._save_index()
+        logger.info(f"Key {key_id} is now active for {algorithm}")
+        return key_id, key
+
+    def list_keys(self):
+        """Key metadata (never key material)"""
+        with self.lock:
+            return {
+                'active': dict(self.index['active']),
+                'keys': {k: dict(v) for k, v in self.index['keys'].items()},
+                'rsa_pool': self.rsa_pool.qsize()
+            }
+
+    def stop(self):
+        """Stop the background generator"""
+        self.running = False
@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+import psutil
+
+logger = logging.getLogger(__name__)
+
+PROC_NET_DEV = '/proc/net/dev'
+
+# Counter names in the order kept per sample
+COUNTERS = ['bytes_recv', 'bytes_sent', 'packets_recv', 'packets_sent',
+            'errin', 'errout', 'dropin', 'dropout']
+
+# Rate names derived from COUNTERS (bytes become bits)
+RATES = ['rx_bps', 'tx_bps', 'rx_pps', 'tx_pps',
+         'rx_errors', 'tx_errors', 'rx_drops', 'tx_drops']
+
+
+def read_proc_net_dev(path=PROC_NET_DEV):
+    """Read per-interface counters from /proc/net/dev"""
+    counters = {}
+    with open(path, 'r') as f:
+        lines = f.readlines()[2:]  # two header lines
+    for line in lines:
+        name, _, data = line.partition(':')
+        fields = data.split()
+        if len(fields) < 16:
+            continue
+        # Receive: bytes packets errs drop ...; transmit starts at field 8
+        counters[name.strip()] = (
+            int(fields[0]), int(fields[8]), int(fields[1]), int(fields[9]),
+            int(fields[2]), int(fields[10]), int(fields[3]), int(fields[11])
+        )
+    return counters
+
+
+def read_psutil_counters():
+    """Read per-interface counters through psutil"""
+    return {
+        name: tuple(getattr(stats, counter) for counter in COUNTERS)
+        for name, stats in psutil.net_io_counters(pernic=True).items()
+    }
+
+
+class LinkMonitor:
+    """Link-level throughput from kernel interface counters, without capture
+
+    Samples interface counters every interval seconds (from /proc/net/dev
+    where available, otherwise psutil) and keeps per-interface rate ring
+    buffers of history samples. Every emit_interval seconds the callback
+    receives the rates averaged over that interval.
+    """
+
+    def __init__(self, callback=None, interval=0.1, history=600, emit_interval=1.0, interfaces=None):
+        self.callback = callback
+        self.interval = interval
+        self.emit_interval = emit_interval
+        self.interfaces = set(interfaces) if interfaces else None
+        self.history = {}
+        self.history_size = history
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.reader = read_proc_net_dev if os.path.exists(PROC_NET_DEV) else read_psutil_counters
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._monitor_worker, daemon=True)
+        self.thread.start()
+        logger.info(f"Link monitor started (interval {self.interval}s)")
+
+    def stop(self):
+        self.running = False
+        logger.info("Link monitor stopped")
+
+    def _read(self):
+        counters = self.reader()
+        if self.interfaces is not None:
+            counters = {name: values for name, values in counters.items() if name in self.interfaces}
+        return counters
+
+    def _monitor_worker(self):
+        """Sample counters, derive rates and push periodic summaries"""
+        try:
+            previous = self._read()
+            previous_time = time.monotonic()
+            emit_start = {name: values for name, values in previous.items()}
+            emit_time = previous_time
+        except Exception as e:
+            logger.error(f"Link monitor error: {e}")
+            self.running = False
+            return
+
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                now = time.monotonic()
+                current = self._read()
+                wall = time.time()
+
+                with self.lock:
+                    for name, values in current.items():
+                        if name in previous:
+                            rates = self._rates(previous[name], values, now - previous_time)
+                            ring = self.history.setdefault(name, deque(maxlen=self.history_size))
+                            ring.append((wall,) + rates)
+                previous, previous_time = current, now
+
+                if now - emit_time >= self.emit_interval:
+                    summary = {
+                        name: dict(zip(RATES, self._rates(emit_start[name], values, now - emit_time)))
+                        for name, values in current.items() if name in emit_start
+                    }
+                    emit_start, emit_time = current, now
+                    if self.callback:
+                        self.callback({'timestamp': wall, 'interfaces': summary})
+
+            except Exception as e:
+                logger.error(f"Link monitor sample error: {e}")
+
+    @staticmethod
+    def _rates(before, after, elapsed):
+        """Per-second rates between two counter tuples (counter resets read as 0)"""
+        if elapsed <= 0:
+            return (0.0,) * len(RATES)
+        rates = []
+        for i, (old, new) in enumerate(zip(before, after)):
+            delta = new - old if new >= old else 0
+            if i < 2:
+                delta *= 8  # bytes -> bits
+            rates.append(delta / elapsed)
+        return tuple(rates)
+
+    def get_history(self, interface=None, samples=None):
+        """Recent rate samples per interface, oldest first"""
+        with self.lock:
+            names = [interface] if interface else list(self.history)
+            result = {}
+            for name in names:
+                ring = list(self.history.get(name, ()))
+                if samples:
+                    ring = ring[-samples:]
+                result[name] = [dict(zip(['timestamp'] + RATES, sample)) for sample in ring]
+            return result
@@ -7,10 +7,84 @@ from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Input, Dense
 import logging
 import pickle
+import copy
 import os
+import threading
+from collections import OrderedDict
+from rule_engine import RuleEngine
+from thresholds import AdaptiveThreshold
 
 logger = logging.getLogger(__name__)
 
+# Fixed autoencoder reconstruction-error threshold, used until adaptive thresholds warm up
+AUTOENCODER_THRESHOLD = 0.1
+
+class PredictionCache:
+    """Bounded LRU cache of raw model scores keyed by quantized features
+
+    Values are dicts of model name -> raw score; the detector applies the
+    current thresholds and cascade bands to them on every hit.
+
+    quantization maps a feature index to a bucket width; features without an
+    entry are used exactly. Wider buckets raise the hit rate at the cost of
+    scoring nearby packets identically.
+    """
+    
+    def __init__(self, max_size=10000, quantization=None):
+        self.max_size = max_size
+        self.quantization = quantization or {}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def key(self, features):
+        """Quantized tuple for a (1, n) feature array"""
+        row = features[0]
+        return tuple(
+            int(value // self.quantization[i]) if i in self.quantization else float(value)
+            for i, value in enumerate(row)
+        )
+    
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all entries, e.g. after the models change"""
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+    
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
 class AnomalyDetector:
     def __init__(self, model_type='both', feature_level='standard'):
         self.model_type = model_type
@@ -19,19 +93,121 @@ class AnomalyDetector:
         self.isolation_forest = None
         self.autoencoder = None
         self.is_trained = False
+        self.cache = None
+        self.rule_engine = RuleEngine()
+        self.thresholds = None
+        
+        # Cascade: rules, then the forest, and only the uncertain band reaches the autoencoder
+        self.cascade_rule_threshold = 0.5
+        self.cascade_normal_margin = 0.05
+        self.cascade_anomaly_margin = 0.05
+        self.cascade_counts = self._new_cascade_counts()
         
         self._initialize_models()
     
+    def configure_cascade(self, rule_threshold=0.5, normal_margin=0.05, anomaly_margin=0.05):
+        """Set the cascade bands
+
+        A rule score >= rule_threshold is confidently anomalous. A forest
+        decision value >= normal_margin is confidently normal and one
+        <= -anomaly_margin confidently anomalous; anything in between is
+        passed to the autoencoder.
+        """
+        self.cascade_rule_threshold = rule_threshold
+        self.cascade_normal_margin = normal_margin
+        self.cascade_anomaly_margin = anomaly_margin
+        self.cascade_counts = self._new_cascade_counts()
+    
+    def configure_thresholds(self, enabled=True, target_rate=0.01, window=10000, buckets=10):
+        """Track per-model score quantiles so thresholds follow a target alert rate"""
+        if enabled:
+            self.thresholds = {
+                'isolation_forest': AdaptiveThreshold(target_rate, window, buckets),
+                'autoencoder': AdaptiveThreshold(target_rate, window, buckets)
+            }
+        else:
+            self.thresholds = None
+    
+    def _reset_thresholds(self):
+        """Start the estimators over, e.g. after the score distribution changed"""
+        for estimator in (self.thresholds or {}).values():
+            with estimator.lock:
+                estimator.reset()
+    
+    def _observe_score(self, model, score):
+        """Feed a score to the model's estimator, whether it was computed or cached"""
+        if self.thresholds:
+            self.thresholds[model].observe(float(score))
+    
+    def threshold_stats(self):
+        """Current thresholds and estimator state per model"""
+        stats = {}
+        if self.isolation_forest is not None and hasattr(self.isolation_forest, 'offset_'):
+            stats['isolation_forest'] = {'default': float(-self.isolation_forest.offset_)}
+        if self.autoencoder:
+            stats['autoencoder'] = {'default': AUTOENCODER_THRESHOLD}
+        for model, estimator in (self.thresholds or {}).items():
+            if model in stats:
+                stats[model].update(estimator.stats())
+        return stats
+    
+    @staticmethod
+    def _new_cascade_counts():
+        return {'packets': 0, 'rules': 0, 'isolation_forest': 0, 'autoencoder': 0}
+    
+    def cascade_stats(self):
+        """Fraction of scored packets that reached each cascade stage"""
+        if self.model_type != 'cascade':
+            return None
+        counts = dict(self.cascade_counts)
+        total = counts['packets']
+        return {
+            'counts': counts,
+            'reached': {stage: (counts[stage] / total if total else 0.0)
+                        for stage in ['rules', 'isolation_forest', 'autoencoder']},
+            'bands': {
+                'rule_threshold': self.cascade_rule_threshold,
+                'normal_margin': self.cascade_normal_margin,
+                'anomaly_margin': self.cascade_anomaly_margin
+            }
+        }
+    
+    def configure_cache(self, max_size=0, length_bucket=1):
+        """Enable the prediction cache (max_size > 0) or disable it"""
+        if max_size > 0:
+            # Feature 0 is the packet length; bucket it so nearby sizes share entries
+            self.cache = PredictionCache(max_size, quantization={0: max(length_bucket, 1)})
+        else:
+            self.cache = None
+    
+    def invalidate_cache(self):
+        """Forget cached predictions; called whenever models change"""
+        if self.cache:
+            self.cache.clear()
+    
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else None
+    
+    @property
+    def uses_rules(self):
+        """Whether predict consults the rules: untrained, or the cascade's first stage"""
+        return not self.is_trained or self.model_type == 'cascade'
+    
+    @property
+    def detector_name(self):
+        """Label of what produces verdicts: 'rules' until trained, then the model type"""
+        return self.model_type if self.is_trained else 'rules'
+    
     def _initialize_models(self):
         """Initialize ML models"""
         try:
-            if self.model_type in ['isolation_forest', 'both']:
+            if self.model_type in ['isolation_forest', 'both', 'cascade']:
                 self.isolation_forest = IsolationForest(
                     contamination=0.1,  # Expect 10% anomalies
                     random_state=42
                 )
             
-            if self.model_type in ['autoencoder', 'both']:
+            if self.model_type in ['autoencoder', 'both', 'cascade']:
                 self._create_autoencoder()
             
             logger.info(f"Initialized models: {self.model_type}")
@@ -39,7 +215,7 @@ class AnomalyDetector:
         except Exception as e:
             logger.error(f"Error initializing models: {e}")
     
-    def _create_autoencoder(self, input_dim=10):
+    def _create_autoencoder(self, input_dim=13):
         """Create autoencoder model"""
         try:
             # Define autoencoder architecture
@@ -62,6 +238,52 @@ class AnomalyDetector:
         except Exception as e:
             logger.error(f"Error creating autoencoder: {e}")
     
+    def reconfigure(self, model_type, feature_level):
+        """Return a detector for new settings, reusing compatible trained models
+
+        The scaler and trained models carry over when the feature level is
+        unchanged; only models that are newly required get built. The
+        detector stays trained only if every required model was carried over.
+        """
+        detector = copy.copy(self)
+        # An instance-level predict (a profiler wrapper) belongs to this detector only
+        detector.__dict__.pop('predict', None)
+        detector.model_type = model_type
+        detector.feature_level = feature_level
+        if self.cache:
+            detector.cache = PredictionCache(self.cache.max_size, dict(self.cache.quantization))
+        detector.cascade_counts = self._new_cascade_counts()
+        if self.thresholds:
+            detector.thresholds = copy.deepcopy(self.thresholds)
+        
+        if feature_level != self.feature_level:
+            detector.scaler = StandardScaler()
+            detector.isolation_forest = None
+            detector.autoencoder = None
+            detector.is_trained = False
+        
+        try:
+            if model_type in ['isolation_forest', 'both', 'cascade']:
+                if detector.isolation_forest is None:
+                    detector.isolation_forest = IsolationForest(contamination=0.1, random_state=42)
+                    detector.is_trained = False
+            else:
+                detector.isolation_forest = None
+            
+            if model_type in ['autoencoder', 'both', 'cascade']:
+                if detector.autoencoder is None:
+                    detector._create_autoencoder()
+                    detector.is_trained = False
+            else:
+                detector.autoencoder = None
+            
+            logger.info(f"Reconfigured models: {model_type} ({feature_level})")
+            
+        except Exception as e:
+            logger.error(f"Error reconfiguring models: {e}")
+        
+        return detector
+    
     def extract_features(self, packet_data):
         """Extract features from packet data"""
         try:
@@ -133,7 +355,7 @@ class AnomalyDetector:
             features_scaled = self.scaler.fit_transform(features)
             
             # Train Isolation Forest
-            if self.isolation_forest:
+            if self.isolation_forest is not None:
                 self.isolation_forest.fit(features_scaled)
                 logger.info("Isolation Forest trained")
             
@@ -150,39 +372,62 @@ class AnomalyDetector:
                 logger.info("Autoencoder trained")
             
             self.is_trained = True
+            self._reset_thresholds()
+            self.invalidate_cache()
             
         except Exception as e:
             logger.error(f"Training error: {e}")
     
-    def predict(self, packet_data):
-        """Predict if packet is anomalous"""
+    def predict(self, packet_data, rule_result=None):
+        """Predict if packet is anomalous
+
+        rule_result is the rule engine's (is_anomaly, score, names) when the
+        caller already evaluated the rules for this packet.
+        """
         try:
             # Extract features
             features = self.extract_features(packet_data)
             
             # If models aren't trained, use simple rule-based detection
             if not self.is_trained:
-                return self._rule_based_detection(packet_data)
-            
-            # Scale features
-            features_scaled = self.scaler.transform(features)
+                return self._rule_based_detection(packet_data, rule_result)
+            
+            # Repetitive traffic maps onto the same quantized key. The cache
+            # holds raw model scores, not verdicts, so the current thresholds
+            # decide every packet and a threshold update needn't clear it
+            scores = None
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache.key(features)
+                scores = self.cache.get(cache_key)
+            if scores is None:
+                scores = {}
+                if cache_key is not None:
+                    self.cache.put(cache_key, scores)
+            
+            scaled = []
+            
+            def features_scaled():
+                if not scaled:
+                    scaled.append(self.scaler.transform(features))
+                return scaled[0]
+            
+            if self.model_type == 'cascade':
+                return self._predict_cascade(packet_data, features_scaled, scores, rule_result)
             
             anomaly_scores = []
             predictions = []
             
             # Isolation Forest prediction
-            if self.isolation_forest:
-                if_pred = self.isolation_forest.predict(features_scaled)[0]
-                if_score = self.isolation_forest.score_samples(features_scaled)[0]
-                predictions.append(if_pred == -1)  # -1 means anomaly
+            if self.isolation_forest is not None:
+                if_score, if_decision = self._forest_score(features_scaled, scores)
+                predictions.append(if_decision < 0)  # negative decision means anomaly
                 anomaly_scores.append(abs(if_score))
             
             # Autoencoder prediction
             if self.autoencoder:
-                reconstruction = self.autoencoder.predict(features_scaled, verbose=0)
-                mse = np.mean(np.power(features_scaled - reconstruction, 2))
-                threshold = 0.1  # Adjustable threshold
-                predictions.append(mse > threshold)
+                mse = self._reconstruction_error(features_scaled, scores)
+                predictions.append(mse > self._autoencoder_threshold())
                 anomaly_scores.append(mse)
             
             # Combine predictions
@@ -190,42 +435,82 @@ class AnomalyDetector:
                 is_anomaly = any(predictions)
                 avg_score = np.mean(anomaly_scores) if anomaly_scores else 0.0
             else:
-                is_anomaly, avg_score = self._rule_based_detection(packet_data)
+                is_anomaly, avg_score = self._rule_based_detection(packet_data, rule_result)
             
-            return is_anomaly, float(avg_score)
+            return bool(is_anomaly), float(avg_score)
             
         except Exception as e:
             logger.error(f"Prediction error: {e}")
             return False, 0.0
     
-    def _rule_based_detection(self, packet_data):
-        """Simple rule-based anomaly detection for fallback"""
+    def _forest_score(self, features_scaled, scores):
+        """Return (score_samples, decision value) from one forest pass
+
+        The raw score is taken from scores (a cache entry) when present and
+        stored there otherwise. The decision value is relative to the
+        adaptive cutoff when enabled, otherwise to the offset fixed by
+        contamination at training time.
+        """
+        score = scores.get('isolation_forest')
+        if score is None:
+            score = scores['isolation_forest'] = float(self.isolation_forest.score_samples(features_scaled())[0])
+        offset = self.isolation_forest.offset_
+        if self.thresholds:
+            # Estimators track -score so that higher means more anomalous
+            self._observe_score('isolation_forest', -score)
+            offset = -self.thresholds['isolation_forest'].value(-offset)
+        return score, score - offset
+    
+    def _reconstruction_error(self, features_scaled, scores):
+        """Autoencoder reconstruction MSE, from scores when present"""
+        mse = scores.get('autoencoder')
+        if mse is None:
+            scaled = features_scaled()
+            reconstruction = self.autoencoder.predict(scaled, verbose=0)
+            mse = scores['autoencoder'] = float(np.mean(np.power(scaled - reconstruction, 2)))
+        self._observe_score('autoencoder', mse)
+        return mse
+    
+    def _autoencoder_threshold(self):
+        if self.thresholds:
+            return self.thresholds['autoencoder'].value(AUTOENCODER_THRESHOLD)
+        return AUTOENCODER_THRESHOLD
+    
+    def _predict_cascade(self, packet_data, features_scaled, scores, rule_result=None):
+        """Score cheapest-first, stopping at the first confident stage
+
+        Rules always run (they read fields the feature key doesn't hold);
+        model scores come from scores when cached, and a stage reached for
+        the first time under the current bands adds its score to the entry.
+        """
+        counts = self.cascade_counts
+        counts['packets'] += 1
+        
+        # Stage 1: rules
+        counts['rules'] += 1
+        rule_anomaly, rule_score = self._rule_based_detection(packet_data, rule_result)
+        if rule_anomaly and rule_score >= self.cascade_rule_threshold:
+            return True, float(rule_score)
+        
+        # Stage 2: isolation forest
+        counts['isolation_forest'] += 1
+        if_score, if_decision = self._forest_score(features_scaled, scores)
+        if if_decision >= self.cascade_normal_margin:
+            return False, float(abs(if_score))
+        if if_decision <= -self.cascade_anomaly_margin:
+            return True, float(abs(if_score))
+        
+        # Stage 3: autoencoder for the uncertain band
+        counts['autoencoder'] += 1
+        mse = self._reconstruction_error(features_scaled, scores)
+        return bool(if_decision < 0 or mse > self._autoencoder_threshold()), float(np.mean([abs(if_score), mse]))
+    
+    def _rule_based_detection(self, packet_data, rule_result=None):
+        """Rule-based anomaly detection via the configured rule engine"""
         try:
-            anomaly_score = 0.0
-            is_anomaly = False
-            
-            # Check packet size
-            length = packet_data.get('length', 0)
-            if length > 8000 or length < 64:  # Unusually large or small packets
-                anomaly_score += 0.5
-                is_anomaly = True
-            
-            # Check for suspicious protocols
-            protocol = packet_data.get('protocol', '').upper()
-            suspicious_protocols = ['UNKNOWN', 'MALFORMED']
-            if protocol in suspicious_protocols:
-                anomaly_score += 0.3
-                is_anomaly = True
-            
-            # Check for private IP to external communication patterns
-            src_ip = packet_data.get('source_ip', '')
-            dst_ip = packet_data.get('destination_ip', '')
-            
-            if src_ip.startswith('192.168.') and not dst_ip.startswith('192.168.'):
-                if length > 5000:  # Large outbound packet
-                    anomaly_score += 0.2
-            
-            return is_anomaly, min(anomaly_score, 1.0)
+            if rule_result is not None:
+                return rule_result[0], rule_result[1]
+            return self.rule_engine.evaluate(packet_data)
             
         except Exception as e:
             logger.error(f"Rule-based detection error: {e}")
@@ -272,6 +557,8 @@ class AnomalyDetector:
             if os.path.exists(ae_path):
                 self.autoencoder = tf.keras.models.load_model(ae_path)
             
+            self._reset_thresholds()
+            self.invalidate_cache()
             logger.info(f"Models loaded from {filepath}")
             
         except Exception as e:
@@ -1,7 +1,10 @@
 import pyshark
 import threading
+import queue
 import time
 import uuid
+import shutil
+import subprocess
 from datetime import datetime
 import logging
 import socket
@@ -9,13 +12,35 @@ import psutil
 
 logger = logging.getLogger(__name__)
 
+# Fields requested from tshark in lean mode, in output column order
+LEAN_FIELDS = [
+    'frame.time_epoch',
+    'frame.len',
+    'frame.protocols',
+    'ip.src',
+    'ip.dst',
+    'ipv6.src',
+    'ipv6.dst',
+    'eth.src',
+    'eth.dst',
+    'tcp.srcport',
+    'tcp.dstport',
+    'udp.srcport',
+    'udp.dstport'
+]
+
 class PacketCapture:
-    def __init__(self, interface='eth0', callback=None):
+    def __init__(self, interface='eth0', callback=None, bpf_filter=None, snaplen=None, capture_mode='lean'):
         self.interface = interface
         self.callback = callback
+        self.bpf_filter = bpf_filter or None
+        self.snaplen = snaplen or None
+        self.capture_mode = capture_mode
         self.capture = None
+        self.process = None
         self.running = False
         self.thread = None
+        self.demo_mode = False
     
     @staticmethod
     def get_available_interfaces():
@@ -69,21 +94,107 @@ class PacketCapture:
                 self.capture.close()
             except:
                 pass
+        if self.process:
+            try:
+                self.process.terminate()
+            except:
+                pass
         logger.info("Packet capture stopped")
     
     def _capture_worker(self):
         """Worker thread for packet capture"""
+        if self.capture_mode == 'lean':
+            self._lean_capture_worker()
+        else:
+            self._full_capture_worker()
+    
+    def _tshark_command(self, tshark_path):
+        """tshark invocation that prints only LEAN_FIELDS, one packet per line"""
+        command = [tshark_path, '-i', self.interface, '-l', '-n',
+                   '-T', 'fields', '-E', 'separator=/t', '-E', 'occurrence=f']
+        if self.bpf_filter:
+            command += ['-f', self.bpf_filter]
+        if self.snaplen:
+            command += ['-s', str(self.snaplen)]
+        for field in LEAN_FIELDS:
+            command += ['-e', field]
+        return command
+    
+    def _lean_capture_worker(self):
+        """Capture via tshark field output, skipping full dissection trees"""
         try:
-            # Create capture object with timeout
+            tshark_path = shutil.which('tshark')
+            if not tshark_path:
+                raise RuntimeError("tshark not found")
+            
+            self.process = subprocess.Popen(
+                self._tshark_command(tshark_path),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1
+            )
+            
+            for line in self.process.stdout:
+                if not self.running:
+                    break
+                
+                packet_data = self._parse_fields_line(line)
+                if packet_data and self.callback:
+                    self.callback(packet_data)
+            
+            # tshark exiting on its own (bad interface, permissions) is a failure
+            if self.running and self.process.wait() != 0:
+                raise RuntimeError(f"tshark exited with status {self.process.returncode}")
+                    
+        except Exception as e:
+            if self.running:
+                logger.error(f"Capture worker error: {e}")
+                self._generate_demo_packets()
+        finally:
+            if self.process and self.process.poll() is None:
+                self.process.terminate()
+    
+    @staticmethod
+    def _parse_fields_line(line):
+        """Parse one tab-separated line of LEAN_FIELDS into our format"""
+        try:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < len(LEAN_FIELDS):
+                return None
+            (epoch, length, protocols, ip_src, ip_dst, ip6_src, ip6_dst, eth_src, eth_dst,
+             tcp_src, tcp_dst, udp_src, udp_dst) = fields[:13]
+            
+            # Same addressing precedence as _parse_packet: IPv4, IPv6, then Ethernet
+            source_ip = ip_src or ip6_src or eth_src or 'unknown'
+            destination_ip = ip_dst or ip6_dst or eth_dst or 'unknown'
+            
+            return {
+                'id': str(uuid.uuid4()),
+                'timestamp': datetime.fromtimestamp(float(epoch)).isoformat() if epoch else datetime.now().isoformat(),
+                'source_ip': source_ip,
+                'destination_ip': destination_ip,
+                'protocol': protocols.rsplit(':', 1)[-1].upper() if protocols else 'unknown',
+                'length': int(length) if length else 0,
+                'source_port': int(tcp_src or udp_src) if (tcp_src or udp_src) else None,
+                'destination_port': int(tcp_dst or udp_dst) if (tcp_dst or udp_dst) else None,
+                'is_anomaly': False,
+                'anomaly_score': 0.0
+            }
+        except Exception as e:
+            logger.debug(f"Error parsing packet fields: {e}")
+            return None
+    
+    def _full_capture_worker(self):
+        """Capture with full pyshark dissection"""
+        try:
+            custom_parameters = {'-s': str(self.snaplen)} if self.snaplen else None
             self.capture = pyshark.LiveCapture(
                 interface=self.interface,
-                display_filter=None,  # Capture all packets
-                only_summaries=False
+                bpf_filter=self.bpf_filter,  # applied in the kernel by dumpcap
+                custom_parameters=custom_parameters
             )
             
-            # Set capture timeout
-            self.capture.set_debug()
-            
             # Start capturing packets
             for packet in self.capture.sniff_continuously():
                 if not self.running:
@@ -107,6 +218,7 @@ class PacketCapture:
     def _generate_demo_packets(self):
         """Generate demo packets for testing when real capture fails"""
         logger.info("Generating demo packets for testing")
+        self.demo_mode = True
         
         demo_protocols = ['TCP', 'UDP', 'HTTP', 'HTTPS', 'DNS', 'ICMP']
         demo_ips = [
@@ -126,6 +238,8 @@ class PacketCapture:
                     'destination_ip': random.choice(demo_ips),
                     'protocol': random.choice(demo_protocols),
                     'length': random.randint(64, 1500),
+                    'source_port': random.randint(1024, 65535),
+                    'destination_port': random.choice([53, 80, 443, 8080]),
                     'is_anomaly': False,
                     'anomaly_score': 0.0
                 }
@@ -155,6 +269,8 @@ class PacketCapture:
                 'destination_ip': 'unknown',
                 'protocol': 'unknown',
                 'length': 0,
+                'source_port': None,
+                'destination_port': None,
                 'is_anomaly': False,
                 'anomaly_score': 0.0
             }
@@ -181,8 +297,135 @@ class PacketCapture:
                     packet_data['source_ip'] = packet.eth.src
                     packet_data['destination_ip'] = packet.eth.dst
             
+            # Transport ports (TCP/UDP) complete the flow 5-tuple
+            transport = getattr(packet, 'transport_layer', None)
+            if transport in ('TCP', 'UDP'):
+                layer = getattr(packet, transport.lower())
+                packet_data['source_port'] = int(layer.srcport)
+                packet_data['destination_port'] = int(layer.dstport)
+            
             return packet_data
             
         except Exception as e:
             logger.debug(f"Error parsing packet: {e}")
-            return None
\ No newline at end of file
+            return None
+
+class MultiInterfaceCapture:
+    """Capture several interfaces concurrently as one time-ordered stream
+
+    Each interface runs its own PacketCapture worker feeding a bounded
+    queue; packets are dropped (and counted) when a queue is full. A merge
+    thread performs a k-way merge on capture timestamp, holding packets
+    for up to merge_delay seconds so slower interfaces can catch up, and
+    tags every packet with the interface it came from.
+    """
+    
+    def __init__(self, interfaces, callback=None, queue_size=10000, merge_delay=0.05, **capture_options):
+        self.interfaces = list(interfaces)
+        self.callback = callback
+        self.merge_delay = merge_delay
+        self.running = False
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.queues = {name: queue.Queue(maxsize=queue_size) for name in self.interfaces}
+        self.stats = {
+            name: {'packets': 0, 'dropped': 0, 'emitted': 0, 'started': None}
+            for name in self.interfaces
+        }
+        self.captures = {
+            name: PacketCapture(name, self._make_enqueue(name), **capture_options)
+            for name in self.interfaces
+        }
+    
+    def _make_enqueue(self, interface):
+        target = self.queues[interface]
+        stats = self.stats[interface]
+        
+        def enqueue(packet_data):
+            packet_data['interface'] = interface
+            stats['packets'] += 1
+            try:
+                target.put_nowait((self._packet_time(packet_data), packet_data))
+                self.wakeup.set()
+            except queue.Full:
+                stats['dropped'] += 1
+        
+        return enqueue
+    
+    @staticmethod
+    def _packet_time(packet_data):
+        try:
+            return datetime.fromisoformat(packet_data['timestamp']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return time.time()
+    
+    def start_capture(self):
+        """Start one capture worker per interface and the merge thread"""
+        if self.running:
+            return
+        
+        self.running = True
+        self.thread = threading.Thread(target=self._merge_worker, daemon=True)
+        self.thread.start()
+        for name, capture in self.captures.items():
+            self.stats[name]['started'] = time.time()
+            capture.start_capture()
+        logger.info(f"Multi-interface capture started on: {', '.join(self.interfaces)}")
+    
+    def stop_capture(self):
+        """Stop all capture workers"""
+        self.running = False
+        for capture in self.captures.values():
+            capture.stop_capture()
+        self.wakeup.set()
+    
+    def _merge_worker(self):
+        """Emit packets from all interfaces in capture-timestamp order"""
+        heads = {}  # interface -> (timestamp, packet) waiting to be merged
+        
+        while self.running:
+            self.wakeup.wait(self.merge_delay)
+            self.wakeup.clear()
+            
+            while True:
+                for name in self.interfaces:
+                    if name not in heads:
+                        try:
+                            heads[name] = self.queues[name].get_nowait()
+                        except queue.Empty:
+                            pass
+                
+                if not heads:
+                    break
+                
+                name = min(heads, key=lambda n: heads[n][0])
+                timestamp, packet_data = heads[name]
+                
+                # An interface with nothing queued may still deliver an older
+                # packet; wait for it unless this one has aged past merge_delay
+                if len(heads) < len(self.interfaces) and timestamp > time.time() - self.merge_delay:
+                    break
+                
+                del heads[name]
+                self.stats[name]['emitted'] += 1
+                try:
+                    if self.callback:
+                        self.callback(packet_data)
+                except Exception as e:
+                    logger.error(f"Error in capture callback: {e}")
+    
+    def get_stats(self):
+        """Per-interface packet, drop and rate counters"""
+        now = time.time()
+        result = {}
+        for name, stats in self.stats.items():
+            elapsed = now - stats['started'] if stats['started'] else 0
+            result[name] = {
+                'packets': stats['packets'],
+                'dropped': stats['dropped'],
+                'emitted': stats['emitted'],
+                'queued': self.queues[name].qsize(),
+                'pps': stats['packets'] / elapsed if elapsed > 0 else 0.0,
+                'demo_mode': self.captures[name].demo_mode
+            }
+        return result
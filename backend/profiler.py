@@ -0,0 +1,143 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import logging
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ['sampling', 'scoring']
+
+TOKEN_ENV = 'SNM_PROFILE_TOKEN'
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, thread_name):
+    """One thread's stack as a root-first, ';'-separated collapsed-stack key"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ';'.join(reversed(labels))
+
+
+def sample_stacks(duration, interval=0.005):
+    """Sample every other thread's stack for duration seconds -> Counter of collapsed stacks"""
+    own = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                stacks[collapse_stack(frame, names.get(ident, f"thread-{ident}"))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+class ProfileSession:
+    """A time-boxed profiling run executed in a background thread
+
+    'sampling' mode samples the stacks of all threads every interval
+    seconds and reports them in collapsed-stack format (one
+    "frame;frame;... count" line per distinct stack, as read by
+    flamegraph.pl and speedscope). 'scoring' mode installs a cProfile
+    wrapper as the target's predict for the duration and reports pstats
+    output; calls that overlap an in-progress profiled call run
+    unprofiled. Nothing is installed or running outside a session.
+    """
+
+    def __init__(self, mode, duration, interval=0.005, target=None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unsupported profile mode: {mode}")
+        if mode == 'scoring' and target is None:
+            raise ValueError("Scoring profile requires an anomaly detector")
+        self.mode = mode
+        self.duration = duration
+        self.interval = interval
+        self.target = target
+        self.started = None
+        self.finished = None
+        self.output = None
+        self.samples = 0
+        self.calls = 0
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self.thread.start()
+        logger.info(f"Started {self.mode} profile for {self.duration}s")
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _run(self):
+        try:
+            if self.mode == 'sampling':
+                stacks, self.samples = sample_stacks(self.duration, self.interval)
+                self.output = '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common())
+            else:
+                self.output = self._profile_scoring()
+        except Exception as e:
+            logger.error(f"Profiling error: {e}")
+            self.error = str(e)
+        self.finished = time.time()
+
+    def _profile_scoring(self):
+        target = self.target
+        predict = target.predict
+        profile = cProfile.Profile()
+        lock = threading.Lock()
+        active = True
+
+        def profiled_predict(packet_data, rule_result=None):
+            if not active or not lock.acquire(blocking=False):
+                return predict(packet_data, rule_result)
+            try:
+                self.calls += 1
+                return profile.runcall(predict, packet_data, rule_result)
+            finally:
+                lock.release()
+
+        target.predict = profiled_predict
+        try:
+            time.sleep(self.duration)
+        finally:
+            active = False
+            target.__dict__.pop('predict', None)
+
+        with lock:
+            stream = io.StringIO()
+            if self.calls:
+                pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(40)
+            return stream.getvalue()
+
+    def status(self, include_output=True):
+        result = {
+            'mode': self.mode,
+            'status': 'running' if self.running else ('error' if self.error else 'done'),
+            'duration': self.duration,
+            'started': datetime.fromtimestamp(self.started).isoformat() if self.started else None,
+            'finished': datetime.fromtimestamp(self.finished).isoformat() if self.finished else None,
+            'samples': self.samples,
+            'calls': self.calls,
+            'error': self.error
+        }
+        if include_output:
+            result['output'] = self.output
+        return result
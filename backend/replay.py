@@ -0,0 +1,74 @@
+import uuid
+import threading
+from collections import deque, Counter
+from itertools import islice
+
+
+class ReplayBuffer:
+    """Sequence-numbered ring of recently emitted events
+
+    Every recorded event gets the next sequence number of this stream; the
+    last capacity events are kept so a reconnecting client can ask for
+    everything after the last sequence it saw. stream_id changes on every
+    restart, so sequences from a previous process are never mistaken for
+    this one. Running totals back the rollup sent when a gap can't be
+    replayed.
+    """
+
+    def __init__(self, capacity=10000, max_gap=5000):
+        self.capacity = capacity
+        self.max_gap = max_gap
+        self.stream_id = uuid.uuid4().hex
+        self.ring = deque(maxlen=capacity)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.events = Counter()
+        self.protocols = Counter()
+        self.anomalies = 0
+
+    def record(self, event, payload):
+        """Assign the next sequence number to payload (as 'seq') and keep it"""
+        with self.lock:
+            self.seq += 1
+            payload['seq'] = self.seq
+            self.ring.append((self.seq, event, payload))
+            self.events[event] += 1
+            if event == 'packet_captured':
+                self.protocols[payload.get('protocol', 'UNKNOWN')] += 1
+                if payload.get('is_anomaly') and not payload.get('alert_opened'):
+                    self.anomalies += 1  # an opening packet is counted in its alert
+            elif event == 'alert':
+                # With aggregation on, anomalous packets are counted in their alerts
+                self.anomalies += payload.get('count', 0)
+            return self.seq
+
+    def since(self, last_seq, stream_id=None):
+        """Events after last_seq, or None when they can't all be replayed"""
+        with self.lock:
+            if stream_id is not None and stream_id != self.stream_id:
+                return None
+            if last_seq > self.seq or self.seq - last_seq > self.max_gap:
+                return None
+            oldest = self.ring[0][0] if self.ring else self.seq + 1
+            if last_seq + 1 < oldest:
+                return None
+            return list(islice(self.ring, last_seq + 1 - oldest, None))
+
+    def position(self):
+        with self.lock:
+            return {
+                'stream_id': self.stream_id,
+                'seq': self.seq,
+                'oldest_seq': self.ring[0][0] if self.ring else None
+            }
+
+    def rollup(self):
+        """Totals since start, for clients whose gap is too large to replay"""
+        with self.lock:
+            return {
+                'stream_id': self.stream_id,
+                'seq': self.seq,
+                'events': dict(self.events),
+                'protocols': dict(self.protocols),
+                'anomalies': self.anomalies
+            }
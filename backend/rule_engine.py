@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import threading
+import logging
+from functools import lru_cache
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Equivalent to the original hardcoded rule-based detection
+DEFAULT_RULES = {
+    'rules': [
+        {
+            'name': 'unusual_frame_size',
+            'weight': 0.5,
+            'anomaly': True,
+            'match': {'length': {'outside': [64, 8000]}}
+        },
+        {
+            'name': 'suspicious_protocol',
+            'weight': 0.3,
+            'anomaly': True,
+            'match': {'protocol': {'in': ['UNKNOWN', 'MALFORMED']}}
+        },
+        {
+            'name': 'large_outbound',
+            'weight': 0.2,
+            'anomaly': False,
+            'match': {
+                'source_ip': {'cidr': ['192.168.0.0/16']},
+                'destination_ip': {'not_cidr': ['192.168.0.0/16']},
+                'length': {'gt': 5000}
+            }
+        }
+    ]
+}
+
+NUMERIC_FIELDS = ['length', 'anomaly_score']
+TEXT_FIELDS = ['protocol']
+IP_FIELDS = ['source_ip', 'destination_ip']
+
+# Below this many packets the scalar function beats building NumPy columns
+BATCH_MIN_PACKETS = 256
+
+
+@lru_cache(maxsize=65536)
+def ipv4_to_int(address):
+    """Dotted-quad IPv4 to an integer, or -1 when not IPv4"""
+    try:
+        parts = address.split('.')
+        if len(parts) != 4:
+            return -1
+        value = 0
+        for part in parts:
+            octet = int(part)
+            if not 0 <= octet <= 255:
+                return -1
+            value = (value << 8) | octet
+        return value
+    except (AttributeError, TypeError, ValueError):
+        return -1
+
+
+def parse_cidr(cidr):
+    """Return the inclusive (low, high) integer range of an IPv4 CIDR block"""
+    address, _, prefix = cidr.partition('/')
+    base = ipv4_to_int(address)
+    if base < 0:
+        raise ValueError(f"Invalid IPv4 CIDR: {cidr}")
+    prefix = int(prefix) if prefix else 32
+    if not 0 <= prefix <= 32:
+        raise ValueError(f"Invalid CIDR prefix: {cidr}")
+    size = 1 << (32 - prefix)
+    low = base & ~(size - 1) & 0xFFFFFFFF
+    return low, low + size - 1
+
+
+def packets_to_columns(packets):
+    """Build the NumPy columns rules are evaluated against"""
+    columns = {}
+    for field in NUMERIC_FIELDS:
+        columns[field] = np.fromiter((p.get(field) or 0 for p in packets),
+                                     dtype=np.float64, count=len(packets))
+    for field in TEXT_FIELDS:
+        columns[field] = np.array([str(p.get(field, '')).upper() for p in packets], dtype=object)
+    for field in IP_FIELDS:
+        columns[field] = np.fromiter((ipv4_to_int(p.get(field, '')) for p in packets),
+                                     dtype=np.int64, count=len(packets))
+    return columns
+
+
+def _compile_condition(field, operator, operand):
+    """Compile one condition into a function of the column dict returning a bool mask"""
+    if field in NUMERIC_FIELDS:
+        if operator == 'gt':
+            return lambda c: c[field] > operand
+        if operator == 'gte':
+            return lambda c: c[field] >= operand
+        if operator == 'lt':
+            return lambda c: c[field] < operand
+        if operator == 'lte':
+            return lambda c: c[field] <= operand
+        if operator == 'between':
+            low, high = operand
+            return lambda c: (c[field] >= low) & (c[field] <= high)
+        if operator == 'outside':
+            low, high = operand
+            return lambda c: (c[field] < low) | (c[field] > high)
+
+    elif field in TEXT_FIELDS:
+        values = np.array([str(v).upper() for v in operand], dtype=object)
+        if operator == 'in':
+            return lambda c: np.isin(c[field], values)
+        if operator == 'not_in':
+            return lambda c: ~np.isin(c[field], values)
+
+    elif field in IP_FIELDS:
+        ranges = np.array([parse_cidr(cidr) for cidr in operand], dtype=np.int64).reshape(-1, 2)
+        lows, highs = ranges[:, 0], ranges[:, 1]
+
+        def in_ranges(c):
+            # Integer range tests: (n, 1) against (1, ranges); non-IPv4 (-1) never matches
+            values = c[field][:, None]
+            return ((values >= lows) & (values <= highs)).any(axis=1)
+
+        if operator == 'cidr':
+            return in_ranges
+        if operator == 'not_cidr':
+            return lambda c: ~in_ranges(c)
+
+    raise ValueError(f"Unsupported rule condition: {field} {operator}")
+
+
+FIELD_READERS = {
+    'length': "float(p.get('length') or 0)",
+    'anomaly_score': "float(p.get('anomaly_score') or 0)",
+    'protocol': "str(p.get('protocol', '')).upper()",
+    'source_ip': "ipv4_to_int(p.get('source_ip', ''))",
+    'destination_ip': "ipv4_to_int(p.get('destination_ip', ''))",
+}
+
+
+def _scalar_expression(field, operator, operand, constant):
+    """Python source testing one condition on local v_<field>
+
+    constant(value) binds an operand into the generated function's globals
+    and returns its name.
+    """
+    v = f"v_{field}"
+    if operator in ('gt', 'gte', 'lt', 'lte'):
+        symbol = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}[operator]
+        return f"{v} {symbol} {constant(float(operand))}"
+    if operator == 'between':
+        low, high = operand
+        return f"{constant(float(low))} <= {v} <= {constant(float(high))}"
+    if operator == 'outside':
+        low, high = operand
+        return f"({v} < {constant(float(low))} or {v} > {constant(float(high))})"
+    if operator in ('in', 'not_in'):
+        values = constant(frozenset(str(value).upper() for value in operand))
+        return f"{v} {'in' if operator == 'in' else 'not in'} {values}"
+    ranges = ' or '.join(
+        f"{constant(low)} <= {v} <= {constant(high)}"
+        for low, high in (parse_cidr(cidr) for cidr in operand)
+    )
+    test = f"({v} >= 0 and ({ranges or 'False'}))"
+    return test if operator == 'cidr' else f"not {test}"
+
+
+def compile_scalar(rules):
+    """Compile a rule list into one function returning the rules a packet matches
+
+    The batch path pays for building NumPy columns, which dominates for a
+    single packet, so the same conditions are also generated as plain
+    Python comparisons; each field is read once per packet.
+    """
+    namespace = {'ipv4_to_int': ipv4_to_int}
+
+    def constant(value):
+        name = f"c{len(namespace)}"
+        namespace[name] = value
+        return name
+
+    fields = sorted({field for rule in rules for field, _, _ in rule.tests})
+    lines = ['def evaluate(p):']
+    lines += [f"    v_{field} = {FIELD_READERS[field]}" for field in fields]
+    lines.append('    matched = []')
+    for rule in rules:
+        tests = [_scalar_expression(field, operator, operand, constant)
+                 for field, operator, operand in rule.tests]
+        lines.append(f"    if {' and '.join(tests) or 'True'}:")
+        lines.append(f"        matched.append({constant(rule)})")
+    lines.append('    return matched')
+
+    exec('\n'.join(lines), namespace)
+    return namespace['evaluate']
+
+
+class CompiledRule:
+    """A rule compiled into NumPy mask expressions for batch evaluation"""
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.weight = float(spec.get('weight', 0.0))
+        self.anomaly = bool(spec.get('anomaly', True))
+        self.tests = [
+            (field, operator, operand)
+            for field, field_tests in spec.get('match', {}).items()
+            for operator, operand in field_tests.items()
+        ]
+        self.conditions = [_compile_condition(*test) for test in self.tests]
+
+    def mask(self, columns, size):
+        result = np.ones(size, dtype=bool)
+        for condition in self.conditions:
+            result &= condition(columns)
+        return result
+
+
+class RuleEngine:
+    """Batch rule evaluation with rule sets loaded from a JSON file
+
+    A rule matches when all of its conditions hold. The score of a packet
+    is the sum of matched rule weights (capped at 1.0) and it is anomalous
+    if any matched rule has "anomaly": true. Conditions:
+
+      length / anomaly_score: gt, gte, lt, lte, between [lo, hi], outside [lo, hi]
+      protocol:               in [...], not_in [...] (case-insensitive)
+      source_ip / destination_ip: cidr [...], not_cidr [...] (IPv4)
+
+    Single packets go through a generated scalar function (evaluate,
+    evaluate_packet) and batches through NumPy masks (evaluate_batch);
+    both give the same verdicts. evaluate_packets picks between them by
+    batch size.
+
+    The file is re-read when its mtime changes (checked at most every
+    reload_interval seconds); a rule file that fails to compile leaves the
+    previous rules in place.
+    """
+
+    def __init__(self, rules_file=None, reload_interval=2.0):
+        self.rules_file = rules_file
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.rules = [CompiledRule(spec) for spec in DEFAULT_RULES['rules']]
+        self.scalar = compile_scalar(self.rules)
+        self.source = 'default'
+        self.loaded_mtime = None
+        self.next_check = 0.0
+        self.version = 0
+        self.reload()
+
+    def reload(self):
+        """Load rules from the rules file; returns True if rules changed"""
+        if not self.rules_file or not os.path.exists(self.rules_file):
+            return False
+        mtime = os.path.getmtime(self.rules_file)
+        try:
+            with open(self.rules_file, 'r') as f:
+                spec = json.load(f)
+            rules = [CompiledRule(rule) for rule in spec['rules']]
+            scalar = compile_scalar(rules)
+        except Exception as e:
+            logger.error(f"Error loading rules from {self.rules_file}: {e}")
+            self.loaded_mtime = mtime  # don't retry until the file changes again
+            return False
+
+        with self.lock:
+            self.rules = rules
+            self.scalar = scalar
+            self.source = self.rules_file
+            self.loaded_mtime = mtime
+            self.version += 1
+        logger.info(f"Loaded {len(rules)} rules from {self.rules_file}")
+        return True
+
+    def _maybe_reload(self):
+        """Cheap periodic mtime check for hot reloading"""
+        now = time.monotonic()
+        if not self.rules_file or now < self.next_check:
+            return
+        self.next_check = now + self.reload_interval
+        try:
+            mtime = os.path.getmtime(self.rules_file)
+        except OSError:
+            return
+        if mtime != self.loaded_mtime:
+            self.reload()
+
+    def evaluate_batch(self, packets):
+        """Return (is_anomaly, score, matched) arrays for a list of packets
+
+        matched maps each rule name to its boolean mask.
+        """
+        self._maybe_reload()
+        rules = self.rules
+        size = len(packets)
+        columns = packets_to_columns(packets)
+
+        score = np.zeros(size, dtype=np.float64)
+        is_anomaly = np.zeros(size, dtype=bool)
+        matched = {}
+        for rule in rules:
+            mask = rule.mask(columns, size)
+            matched[rule.name] = mask
+            score += mask * rule.weight
+            if rule.anomaly:
+                is_anomaly |= mask
+        return is_anomaly, np.minimum(score, 1.0), matched
+
+    def evaluate_packets(self, packets):
+        """evaluate_packet's (is_anomaly, score, names) for each packet of a batch"""
+        if len(packets) < BATCH_MIN_PACKETS:
+            return [self.evaluate_packet(packet_data) for packet_data in packets]
+        is_anomaly, score, matched = self.evaluate_batch(packets)
+        names = [[] for _ in packets]
+        for name, mask in matched.items():  # rule order, as in the scalar path
+            for position in np.flatnonzero(mask):
+                names[position].append(name)
+        return [(bool(a), float(s), n) for a, s, n in zip(is_anomaly.tolist(), score.tolist(), names)]
+
+    def evaluate(self, packet_data):
+        """Evaluate a single packet, returning (is_anomaly, score)"""
+        is_anomaly, score, _ = self.evaluate_packet(packet_data)
+        return is_anomaly, score
+
+    def evaluate_packet(self, packet_data):
+        """Scalar path for one packet: (is_anomaly, score, matched rule names)
+
+        Gives the same verdicts as evaluate_batch without building NumPy
+        columns, which dominate the cost for a single packet.
+        """
+        self._maybe_reload()
+        matched = self.scalar(packet_data)
+        if not matched:
+            return False, 0.0, []
+        score = 0.0
+        is_anomaly = False
+        for rule in matched:
+            score += rule.weight
+            is_anomaly = is_anomaly or rule.anomaly
+        return is_anomaly, min(score, 1.0), [rule.name for rule in matched]
+
+    def describe(self):
+        with self.lock:
+            return {
+                'source': self.source,
+                'rules': [{'name': r.name, 'weight': r.weight, 'anomaly': r.anomaly} for r in self.rules]
+            }
@@ -0,0 +1,533 @@
+import os
+import hmac
+import json
+import time
+import zlib
+import queue
+import socket
+import struct
+import hashlib
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Frame: magic(4) version(1) type(1) payload_length(4), then the payload.
+# On connect the collector sends a CHALLENGE (a random nonce) and the agent
+# answers with a JSON HELLO. BATCH payloads are a sequence number, an
+# HMAC-SHA256 tag (zeros without a shared secret) and zlib-compressed NDJSON
+# packets; ACK payloads are the sequence number of an accepted batch.
+FRAME_MAGIC = b'SNMF'
+FRAME_VERSION = 3
+FRAME_HEADER = struct.Struct('>4sBBI')
+FRAME_HELLO = 1
+FRAME_BATCH = 2
+FRAME_ACK = 3
+FRAME_CHALLENGE = 4
+SEQUENCE = struct.Struct('>Q')
+NONCE_SIZE = 16
+TAG_SIZE = 32
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+MAX_BATCH_SIZE = 256 * 1024 * 1024  # decompressed
+
+SECRET_ENV = 'SNM_AGENT_SECRET'
+
+# Set by agents that score locally; only kept from authenticated agents
+AGENT_VERDICT_FIELDS = ['scored_locally', 'is_anomaly', 'anomaly_score', 'detector', 'rules']
+
+
+def encode_frame(frame_type, payload):
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, frame_type, len(payload)) + payload
+
+
+def hello_auth(secret, nonce, agent_id, session):
+    """Proof that a HELLO for this challenge comes from a holder of the secret"""
+    message = b'hello|' + nonce + f"|{agent_id}|{session}".encode('utf-8')
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()
+
+
+def batch_key(secret, nonce):
+    """Per-connection key for batch tags, so batches can't be replayed elsewhere"""
+    return hmac.new(secret, b'batch|' + nonce, hashlib.sha256).digest()
+
+
+def compress_batch(packets, level=6):
+    """NDJSON-encode and compress a list of packets"""
+    body = '\n'.join(json.dumps(p, separators=(',', ':')) for p in packets).encode('utf-8')
+    return zlib.compress(body, level)
+
+
+def encode_batch(seq, body, key=None):
+    """BATCH frame numbered seq for a compressed body, tagged under key if given"""
+    header = SEQUENCE.pack(seq)
+    tag = hmac.new(key, header + body, hashlib.sha256).digest() if key else bytes(TAG_SIZE)
+    return encode_frame(FRAME_BATCH, header + tag + body)
+
+
+def decode_batch(payload, key=None):
+    """BATCH payload -> (seq, packets); with a key the tag must verify"""
+    header = payload[:SEQUENCE.size]
+    seq, = SEQUENCE.unpack(header)
+    tag = payload[SEQUENCE.size:SEQUENCE.size + TAG_SIZE]
+    body = payload[SEQUENCE.size + TAG_SIZE:]
+    if key and not hmac.compare_digest(tag, hmac.new(key, header + body, hashlib.sha256).digest()):
+        raise ValueError(f"Batch {seq} failed authentication")
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(body, MAX_BATCH_SIZE)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError(f"Batch {seq} is truncated or decompresses beyond {MAX_BATCH_SIZE} bytes")
+    return seq, [json.loads(line) for line in data.decode('utf-8').split('\n') if line]
+
+
+def parse_address(address):
+    """'host:port' for TCP or 'unix:/path' for a Unix socket -> (family, sockaddr)"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(sock):
+    """Read one (frame_type, payload) from a socket"""
+    magic, version, frame_type, length = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError("Invalid frame header")
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame too large: {length}")
+    return frame_type, _recv_exact(sock, length)
+
+
+class SensorAgent:
+    """Headless sensor that ships packet batches to a collector
+
+    Packets are grouped into batches of batch_size (or whatever arrived
+    within flush_interval), compressed, numbered and queued for a sender
+    thread that keeps a connection to the collector, reconnecting with
+    backoff. A batch stays in the spool until the collector acknowledges
+    it; up to max_in_flight batches are sent ahead of their ACKs. If no ACK
+    arrives within ack_timeout the connection is treated as dead and every
+    unacknowledged batch is resent on the next one, so delivery is
+    at-least-once (the collector discards resent batches it already
+    accepted). While the collector is unreachable up to spool_batches
+    batches are held; beyond that the oldest batches are dropped and counted,
+    as are batches that fail to encode. With a shared secret the agent
+    answers the collector's challenge and tags every batch with an HMAC.
+    """
+
+    def __init__(self, collector_address, agent_id=None, batch_size=500, flush_interval=0.5,
+                 spool_batches=1000, compression_level=6, interfaces=None,
+                 max_in_flight=8, ack_timeout=10.0, secret=None):
+        self.collector_address = collector_address
+        if not isinstance(compression_level, int) or not 0 <= compression_level <= 9:
+            raise ValueError(f"Agent compression level must be an integer from 0 to 9, got {compression_level!r}")
+        self.agent_id = agent_id or socket.gethostname()
+        self.session = os.urandom(8).hex()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compression_level = compression_level
+        self.interfaces = interfaces or []
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.batch_key = None  # per connection
+        self.lock = threading.Condition()
+        self.batch = []
+        self.spool = deque()  # (seq, packet count, compressed body), oldest first
+        self.spool_batches = spool_batches
+        self.next_seq = 1
+        self.sent_seq = 0  # highest seq written on the current connection
+        self.acked_seq = 0
+        self.ack_deadline = None
+        self.sock = None
+        self.running = False
+        self.stop_deadline = None
+        self.thread = None
+        self.stats = {
+            'packets': 0, 'batches_sent': 0, 'batches_acked': 0, 'packets_acked': 0,
+            'bytes_sent': 0, 'resent_batches': 0, 'dropped_packets': 0, 'encode_errors': 0, 'reconnects': 0,
+            'connected': False
+        }
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._sender_worker, daemon=True)
+        self.thread.start()
+        logger.info(f"Sensor agent {self.agent_id} shipping to {self.collector_address}")
+
+    def stop(self, timeout=5):
+        """Flush, then wait up to timeout seconds for the spool to be acknowledged"""
+        with self.lock:
+            self._flush_locked()
+            self.running = False
+            self.stop_deadline = time.monotonic() + timeout
+            self.lock.notify_all()
+        if self.thread:
+            self.thread.join(timeout=timeout)
+        with self.lock:
+            self._disconnect_locked()
+
+    def submit(self, packet_data):
+        """Queue a packet for the next batch"""
+        with self.lock:
+            self.batch.append(packet_data)
+            self.stats['packets'] += 1
+            if len(self.batch) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        try:
+            body = compress_batch(batch, self.compression_level)
+        except Exception as e:
+            # Keeping the batch would fail the same way on every flush
+            logger.error(f"Dropping batch of {len(batch)} packets that failed to encode: {e}")
+            self.stats['encode_errors'] += 1
+            self.stats['dropped_packets'] += len(batch)
+            return
+        self.spool.append((self.next_seq, len(batch), body))
+        self.next_seq += 1
+        while len(self.spool) > self.spool_batches:
+            _, count, _ = self.spool.popleft()
+            self.stats['dropped_packets'] += count
+        self.lock.notify_all()
+
+    def _next_frame_locked(self):
+        """Oldest spooled batch not yet sent on this connection, if the window allows"""
+        if self.sent_seq - self.acked_seq >= self.max_in_flight:
+            return None
+        for seq, count, body in self.spool:
+            if seq > self.sent_seq:
+                # Tagged at send time: the key changes with every connection
+                return seq, encode_batch(seq, body, self.batch_key)
+        return None
+
+    def _sender_worker(self):
+        backoff = 0.5
+        acked = 0
+        last_flush = time.monotonic()
+        while True:
+            with self.lock:
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush_locked()
+                    last_flush = time.monotonic()
+                if not self.spool and not self.running:
+                    return
+                sock = self.sock
+                stalled = (sock is not None and self.sent_seq > self.acked_seq
+                           and time.monotonic() > self.ack_deadline)
+                entry = self._next_frame_locked() if sock is not None and not stalled else None
+                if entry is None and not stalled and (sock is not None or not self.spool):
+                    self.lock.wait(self.flush_interval)
+                    continue
+
+            try:
+                if stalled:
+                    raise TimeoutError(f"no ACK within {self.ack_timeout}s")
+                if sock is None:
+                    sock = self._connect()
+                    continue  # recompute the window for the new connection
+                seq, frame = entry
+                sock.sendall(frame)
+            except OSError as e:
+                if self.stats['connected']:
+                    logger.warning(f"Lost connection to collector: {e}")
+                with self.lock:
+                    self._disconnect_locked()
+                if not self.running and time.monotonic() + backoff >= self.stop_deadline:
+                    return
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+                continue
+
+            with self.lock:
+                # Only ACKs show the collector accepted us; a rejected agent keeps backing off
+                if self.stats['batches_acked'] > acked:
+                    acked = self.stats['batches_acked']
+                    backoff = 0.5
+                if sock is not self.sock:
+                    continue
+                if self.sent_seq <= self.acked_seq:
+                    self.ack_deadline = time.monotonic() + self.ack_timeout
+                self.sent_seq = max(self.sent_seq, seq)
+                self.stats['batches_sent'] += 1
+                self.stats['bytes_sent'] += len(frame)
+
+    def _ack_worker(self, sock):
+        """Read ACKs for one connection and release acknowledged batches"""
+        while True:
+            try:
+                frame_type, payload = read_frame(sock)
+            except socket.timeout:
+                if sock is self.sock:
+                    continue
+                return
+            except (OSError, ValueError) as e:
+                with self.lock:
+                    if sock is self.sock:
+                        # Let the sender reconnect now instead of at its next send
+                        logger.warning(f"Lost connection to collector: {e}")
+                        self._disconnect_locked()
+                        self.lock.notify_all()
+                return
+            if frame_type != FRAME_ACK:
+                continue
+            seq, = SEQUENCE.unpack(payload)
+            with self.lock:
+                if sock is not self.sock:
+                    return
+                self.acked_seq = max(self.acked_seq, seq)
+                self.ack_deadline = time.monotonic() + self.ack_timeout
+                while self.spool and self.spool[0][0] <= self.acked_seq:
+                    _, count, _ = self.spool.popleft()
+                    self.stats['batches_acked'] += 1
+                    self.stats['packets_acked'] += count
+                self.lock.notify_all()
+
+    def _connect(self):
+        family, address = parse_address(self.collector_address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(10)
+        try:
+            sock.connect(address)
+            frame_type, nonce = read_frame(sock)
+            if frame_type != FRAME_CHALLENGE:
+                raise ValueError("Expected CHALLENGE frame")
+            hello = {
+                'agent_id': self.agent_id,
+                'session': self.session,
+                'interfaces': self.interfaces,
+                'pid': os.getpid()
+            }
+            if self.secret:
+                hello['auth'] = hello_auth(self.secret, nonce, self.agent_id, self.session)
+            sock.sendall(encode_frame(FRAME_HELLO, json.dumps(hello).encode('utf-8')))
+        except (OSError, ValueError) as e:
+            sock.close()
+            raise ConnectionError(f"Handshake failed: {e}") from e
+        with self.lock:
+            self.sock = sock
+            self.batch_key = batch_key(self.secret, nonce) if self.secret else None
+            # Everything still spooled is unacknowledged and goes out again
+            self.stats['resent_batches'] += sum(1 for seq, _, _ in self.spool if seq <= self.sent_seq)
+            self.sent_seq = self.acked_seq = self.spool[0][0] - 1 if self.spool else self.next_seq - 1
+            self.stats['connected'] = True
+            self.stats['reconnects'] += 1
+        threading.Thread(target=self._ack_worker, args=(sock,), daemon=True).start()
+        logger.info(f"Connected to collector {self.collector_address}")
+        return sock
+
+    def _disconnect_locked(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.stats['connected'] = False
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, spooled_batches=len(self.spool), agent_id=self.agent_id)
+
+
+class CollectorServer:
+    """Receives batches from sensor agents and feeds one merged stream
+
+    Each agent connection is read by its own thread; decoded packets are
+    tagged with the agent id and pushed into a bounded queue drained by a
+    single dispatcher thread, so the callback sees one serialized stream.
+    The dispatcher hands the callback lists of up to dispatch_size packets
+    (whatever is queued), so it can work on them as a batch.
+    A batch is acknowledged once all its packets are queued; while the
+    queue is full the connection thread waits, so backpressure reaches the
+    agents' spools instead of dropping packets here. Batches resent after a
+    lost ACK are recognised by sequence number and acknowledged again
+    without being queued twice.
+
+    With a shared secret only agents that answer the connection's challenge
+    are accepted and every batch tag is verified. Verdicts set by agents
+    (AGENT_VERDICT_FIELDS) are kept from authenticated agents only and
+    stripped otherwise, so the packets are scored here.
+    """
+
+    def __init__(self, address, callback, queue_size=100000, dispatch_size=512, secret=None):
+        self.address = address
+        self.callback = callback
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.dispatch_size = dispatch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.server = None
+        self.dispatcher = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.agents = {}
+        self.connections = set()
+
+    def start(self):
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen()
+        self.running = True
+        threading.Thread(target=self._accept_worker, daemon=True).start()
+        self.dispatcher = threading.Thread(target=self._dispatch_worker, daemon=True)
+        self.dispatcher.start()
+        logger.info(f"Collector listening on {self.address}")
+
+    def stop(self, timeout=5):
+        """Close every connection, then deliver the packets already acknowledged"""
+        self.running = False
+        with self.lock:
+            sockets = list(self.connections)
+        if self.server:
+            sockets.append(self.server)
+        for sock in sockets:
+            # shutdown() wakes threads blocked in accept()/recv(); close() alone doesn't
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if self.dispatcher:
+            self.dispatcher.join(timeout=timeout)
+
+    @property
+    def bound_address(self):
+        """Actual listening address (useful when binding to port 0)"""
+        return self.server.getsockname() if self.server else None
+
+    def _accept_worker(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break
+            if not self.running:
+                conn.close()
+                break
+            with self.lock:
+                self.connections.add(conn)
+            threading.Thread(target=self._connection_worker, args=(conn,), daemon=True).start()
+
+    def _connection_worker(self, conn):
+        agent_id = None
+        try:
+            nonce = os.urandom(NONCE_SIZE)
+            conn.sendall(encode_frame(FRAME_CHALLENGE, nonce))
+            frame_type, payload = read_frame(conn)
+            if frame_type != FRAME_HELLO:
+                raise ValueError("Expected HELLO frame")
+            hello = json.loads(payload)
+            session = hello.get('session')
+            key = None
+            if self.secret:
+                expected = hello_auth(self.secret, nonce, hello.get('agent_id'), session)
+                if not hmac.compare_digest(str(hello.get('auth', '')), expected):
+                    raise ValueError(f"Rejected unauthenticated agent {hello.get('agent_id')!r}")
+                key = batch_key(self.secret, nonce)
+            agent_id = str(hello.get('agent_id'))
+            with self.lock:
+                stats = self.agents.setdefault(agent_id, {
+                    'batches': 0, 'packets': 0, 'duplicates': 0, 'connections': 0
+                })
+                if stats.get('session') != session:
+                    # A restarted agent numbers its batches from 1 again
+                    stats.update(session=session, last_seq=0)
+                stats.update(connected=True, interfaces=hello.get('interfaces', []),
+                             authenticated=key is not None, last_seen=time.time())
+                stats['connections'] += 1
+            logger.info(f"Sensor agent {agent_id} connected")
+
+            while self.running:
+                frame_type, payload = read_frame(conn)
+                if frame_type != FRAME_BATCH:
+                    continue
+                seq, packets = decode_batch(payload, key)
+                with self.lock:
+                    if stats['session'] != session:
+                        break  # superseded by a newer session of this agent id
+                    stats['last_seen'] = time.time()
+                    duplicate = seq <= stats['last_seq']
+                    if duplicate:
+                        stats['duplicates'] += 1
+                    else:
+                        stats['last_seq'] = seq
+                if not duplicate:
+                    for packet_data in packets:
+                        if key is None:
+                            for field in AGENT_VERDICT_FIELDS:
+                                packet_data.pop(field, None)
+                        packet_data['agent'] = agent_id
+                        self._enqueue(packet_data)
+                    if not self.running:
+                        break  # not accepted; the agent resends it elsewhere
+                    with self.lock:
+                        stats['batches'] += 1
+                        stats['packets'] += len(packets)
+                conn.sendall(encode_frame(FRAME_ACK, SEQUENCE.pack(seq)))
+
+        except (ConnectionError, OSError):
+            pass
+        except Exception as e:
+            logger.error(f"Collector connection error from {agent_id}: {e}")
+        finally:
+            with self.lock:
+                self.connections.discard(conn)
+            conn.close()
+            if agent_id is not None:
+                with self.lock:
+                    self.agents[agent_id]['connected'] = False
+                logger.info(f"Sensor agent {agent_id} disconnected")
+
+    def _enqueue(self, packet_data):
+        """Block while the queue is full so a slow callback pushes back on the agents"""
+        while self.running:
+            try:
+                self.queue.put(packet_data, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _dispatch_worker(self):
+        # After stop() the queue is drained, since its batches were acknowledged
+        while True:
+            try:
+                packets = [self.queue.get(timeout=0.5)]
+            except queue.Empty:
+                if not self.running:
+                    return
+                continue
+            while len(packets) < self.dispatch_size:
+                try:
+                    packets.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.callback(packets)
+            except Exception as e:
+                logger.error(f"Error in collector callback: {e}")
+
+    def get_stats(self):
+        with self.lock:
+            return {agent: dict(stats) for agent, stats in self.agents.items()}
@@ -8,6 +8,7 @@ and environment setup.
 
 import os
 import sys
+import argparse
 import subprocess
 import logging
 
@@ -51,6 +52,13 @@ def check_system_dependencies():
 
 def main():
     """Main startup function"""
+    parser = argparse.ArgumentParser(description="Smart Network Monitor Backend")
+    parser.add_argument('--production', action='store_true',
+                        help="serve with eventlet, without debug mode or per-frame logging")
+    parser.add_argument('--profiling', action='store_true',
+                        help="expose /api/admin/profile for this run")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("Smart Network Monitor Backend")
     print("=" * 60)
@@ -63,7 +71,8 @@ def main():
     check_system_dependencies()
     
     # Set environment variables
-    os.environ['FLASK_ENV'] = 'development'
+    if not args.production:
+        os.environ['FLASK_ENV'] = 'development'
     
     print("\nStarting backend server...")
     print("Frontend should connect to: http://127.0.0.1:5000")
@@ -72,14 +81,11 @@ def main():
     
     try:
         # Import and run the main application
-        from app import socketio, app
-        socketio.run(
-            app,
-            host='127.0.0.1',
-            port=5000,
-            debug=True,
-            allow_unsafe_werkzeug=True
-        )
+        from app import config, initialize_components, run_server
+        if args.profiling:
+            config.override('profiling_enabled', True)
+        initialize_components()
+        run_server(production=True if args.production else None)
     except KeyboardInterrupt:
         print("\nShutting down backend server...")
     except Exception as e:
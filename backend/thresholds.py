@@ -0,0 +1,155 @@
+import threading
+from collections import deque
+
+
+class P2Quantile:
+    """Constant-memory streaming quantile estimate (Jain & Chlamtac P-square)"""
+
+    def __init__(self, quantile):
+        self.quantile = quantile
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value):
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+
+        q = self.heights
+        n = self.positions
+
+        # Find the cell containing the value, stretching the extremes if needed
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Adjust the three middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i, step):
+        q = self.heights
+        n = self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            ordered = sorted(self.heights)
+            return ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)]
+        return self.heights[2]
+
+
+class AdaptiveThreshold:
+    """Score threshold that tracks a target alert rate over a sliding window
+
+    The window is split into buckets, each summarized by a P-square
+    estimator of the (1 - target_rate) quantile; the threshold is the
+    count-weighted mean of the bucket estimates, so memory is constant and
+    old traffic ages out one bucket at a time. Scores are buffered and
+    folded in batches of batch_size. Until min_samples scores have been
+    seen the caller's default threshold applies.
+    """
+
+    def __init__(self, target_rate=0.01, window=10000, buckets=10, min_samples=500, batch_size=256):
+        self.target_rate = target_rate
+        self.quantile = 1.0 - target_rate
+        self.bucket_size = max(window // buckets, 1)
+        self.min_samples = min_samples
+        self.batch_size = batch_size
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all observed scores"""
+        self.pending = []
+        self.closed = deque(maxlen=max(self.buckets - 1, 1))  # (count, estimate) of full buckets
+        self.current = P2Quantile(self.quantile)
+        self.observed = 0
+        self.alerts = 0
+        self.threshold = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def observe(self, score):
+        """Record a score; returns True when a window bucket rolled over"""
+        with self.lock:
+            self.pending.append(score)
+            if len(self.pending) < self.batch_size:
+                return False
+            return self._flush_locked()
+
+    def _flush_locked(self):
+        rotated = False
+        for score in self.pending:
+            self.current.add(score)
+            self.observed += 1
+            if self.threshold is not None and score > self.threshold:
+                self.alerts += 1
+            if self.current.count >= self.bucket_size:
+                self.closed.append((self.current.count, self.current.value()))
+                self.current = P2Quantile(self.quantile)
+                rotated = True
+        self.pending = []
+
+        buckets = list(self.closed)
+        if self.current.count >= 5:
+            buckets.append((self.current.count, self.current.value()))
+        total = sum(count for count, _ in buckets)
+        if total >= self.min_samples:
+            self.threshold = sum(count * value for count, value in buckets) / total
+        return rotated
+
+    def value(self, default):
+        """Current threshold, or default while warming up"""
+        threshold = self.threshold
+        return default if threshold is None else threshold
+
+    def stats(self):
+        with self.lock:
+            return {
+                'target_rate': self.target_rate,
+                'quantile': self.quantile,
+                'threshold': self.threshold,
+                'observed': self.observed,
+                'observed_alert_rate': self.alerts / self.observed if self.observed else 0.0,
+                'bucket_quantiles': [value for _, value in self.closed] + (
+                    [self.current.value()] if self.current.count else []
+                )
+            }